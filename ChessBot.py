@@ -1,54 +1,631 @@
+import json
+import multiprocessing
+import os
 import random
-import ChessLib
+import threading
+import time
+from ChessLib import Move, CastleRights, NO_PIECE, PROMOTION, FIFTY_MOVE_LIMIT
+from mailbox_board import MailboxGameState
+from bitboard import BitboardGameState
+from evaluation import piece_number_centipawns
+from transposition import TranspositionTable, EXACT, LOWER, UPPER, NO_MOVE
+from move_ordering import MoveOrderer, MAX_PLY
+from book import OpeningBook
+import profiling
 
+# scores are integer centipawns from the evaluation, far above any material balance for a mate
 CHECKMATE = 10000
+# a mate ply plies from the root scores CHECKMATE - ply, so anything beyond this is a mate
+MATE_THRESHOLD = CHECKMATE - 2 * MAX_PLY
 STALEMATE = 0
-DEPTH = 3
-
-piece_position_values = {"wB": ChessLib.bishop_values,
-                         "bB": ChessLib.bishop_values[::-1],
-                         "wN": ChessLib.knight_values,
-                         "bN": ChessLib.knight_values[::-1],
-                         "wR": ChessLib.rook_values,
-                         "bR": ChessLib.rook_values[::-1],
-                         "wp": ChessLib.pawn_values,
-                         "bp": ChessLib.pawn_values[::-1],
-                         "wQ": ChessLib.queen_values,
-                         "bQ": ChessLib.queen_values[::-1]
-                         }
+# score of a repetition or a fifty-move draw inside the search
+DRAW = 0
+MAX_DEPTH = 20
+# seconds per move, None searches every iteration up to the depth limit
+TIME_LIMIT = 2.0
+# how many nodes pass between two looks at the clock
+NODE_CHECK_INTERVAL = 1024
+# seconds between two looks at the stop flag while the pool searches the root moves
+POOL_POLL_INTERVAL = 0.005
+# search captures past the depth limit until the position is quiet
+QUIESCENCE = True
+# centipawns of slack for delta pruning in the quiescence search
+DELTA_MARGIN = 200
+# selective search, every part can be switched off on its own to compare
+# principal variation search: moves after the first get a zero window and are searched again if they beat alpha
+PVS = True
+# scores are integers, so a window one centipawn wide is a zero window
+ZERO_WINDOW = 1
+# null-move pruning: pass the turn and cut off if a shallower search still beats beta
+NULL_MOVE = True
+NULL_MOVE_REDUCTION = 2
+# late move reductions: quiet moves late in the ordering are searched a ply shallower first
+LMR = True
+LMR_MIN_DEPTH = 3
+LMR_FULL_MOVES = 3
+# from this move on the reduction is two plies
+LMR_LATE_MOVES = 8
+# a side in check is searched a ply deeper
+CHECK_EXTENSION = True
+# board representation the search runs on, "string" searches engine.GameState directly
+BACKEND = "bitboard"
+BACKENDS = {"mailbox": MailboxGameState, "bitboard": BitboardGameState}
+TT_SIZE_MB = 16
+# processes searching the root moves, 1 keeps the whole search in the calling process
+WORKERS = 1
+# Polyglot format book played from while the position is in it, see book.py to build one
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.bin")
+# every search appends its statistics to this file as one JSON line, None keeps them in the context's last_stats only
+STATS_PATH = None
+# time move generation, make/undo and scoring on the search board, the wrappers slow the search down
+PHASE_TIMES = False
+SEARCH_PHASES = ("get_packed_moves", "get_staged_moves", "get_capture_moves", "make_move", "undo_move",
+                 "make_null_move", "undo_null_move", "in_check")
+# "cprofile" or "sampling" profiles every search and writes the report into PROFILE_DIR
+PROFILER = None
+PROFILE_DIR = "profiles"
+
+worker_pool = None
+opening_book = None
+worker_pool_size = 0
+# one root split at a time uses the pool, searches of other contexts wait for it
+pool_lock = threading.Lock()
+# best root score found so far in the current iteration, shared with the pool workers
+shared_alpha = None
+# set to stop every pool worker's search, a multiprocessing.Event shared like shared_alpha
+shared_stop = None
+
+
+class SearchContext:
+    """
+    Everything one search reads and writes: its tables, limits, counters, best root move and stop flag.
+    Every game keeps its own context, so the searches of independent games can run side by side in
+    one process, on threads or driven by an event loop, and learn nothing from each other.
+    The tables persist from move to move, the rest is reset by start().
+    """
+
+    def __init__(self, transposition_table=None, move_orderer=None):
+        self.transposition_table = transposition_table if transposition_table is not None else TranspositionTable(
+            TT_SIZE_MB)
+        self.move_orderer = move_orderer if move_orderer is not None else MoveOrderer()
+        # statistics of the last finished search, see search_stats
+        self.last_stats = None
+        self.start(0)
+
+    def new_game(self):
+        # forget everything learned about the previous game
+        self.transposition_table.clear()
+        self.move_orderer = MoveOrderer()
+
+    def start(self, root_ply, time_limit=None, node_limit=None, stop_event=None):
+        self.root_ply = root_ply
+        self.deadline = time.perf_counter() + time_limit if time_limit is not None else None
+        self.node_limit = node_limit
+        self.stop_event = stop_event
+        self.depth = 0
+        self.stopped = False
+        # best root move of the iteration being searched
+        self.best_move = None
+        self.nodes = 0
+        self.quiescence_nodes = 0
+        self.null_move_cutoffs = 0
+        self.re_searches = 0
+        # nodes scored as a draw by repetition or the fifty-move rule without being searched
+        self.draws = 0
+
+    def limit_reached(self):
+        # the first iteration always finishes so there is a move to play
+        if self.depth == 1:
+            return False
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            return True
+        if self.stop_event is not None and self.stop_event.is_set():
+            return True
+        return self.deadline is not None and time.perf_counter() >= self.deadline
+
+    def counters(self):
+        return self.nodes, self.quiescence_nodes, self.null_move_cutoffs, self.re_searches, self.draws
+
+    def add_counters(self, counters):
+        # counters of a search that ran somewhere else, a pool worker
+        self.nodes += counters[0]
+        self.quiescence_nodes += counters[1]
+        self.null_move_cutoffs += counters[2]
+        self.re_searches += counters[3]
+        self.draws += counters[4]
+
+    def evaluate(self, game_state):
+        # the static score of stand pat and null-move pruning, a method so PHASE_TIMES can time it as well
+        return game_state.position_score
+
+    def score_chess_board(self, game_state):
+        # the leaf score without quiescence, a method so PHASE_TIMES can time it for this context alone
+        return score_chess_board(game_state)
+
+    def search_stats(self, search_state, best_move, score, iterations, elapsed, backend, workers, timers=()):
+        """
+        What the search did, as a dict that json.dumps can write.
+        branching_factor is the effective one, nodes of the last finished iteration over those of the one before.
+        phases holds the calls and inclusive time of the board methods, evaluate and score_chess_board when PHASE_TIMES
+        is set, the material and piece-square score itself is kept up to date inside make_move.
+        """
+        stats = {"fen": search_state.to_fen(), "backend": backend, "workers": workers,
+                 "bestmove": Move.from_packed(best_move).get_uci_notation() if best_move is not None else None,
+                 "score": score, "depth": iterations[-1]["depth"] if iterations else 0,
+                 "nodes": self.nodes, "qnodes": self.quiescence_nodes, "time": round(elapsed, 6),
+                 "nps": int(self.nodes / max(elapsed, 1e-6)), "null_move_cutoffs": self.null_move_cutoffs,
+                 "re_searches": self.re_searches, "draws": self.draws, "iterations": iterations,
+                 "branching_factor": round(iterations[-1]["nodes"] / max(iterations[-2]["nodes"], 1), 3)
+                 if len(iterations) > 1 else None,
+                 "move_ordering": self.move_orderer.stats(), "transposition_table": self.transposition_table.stats()}
+        if timers:
+            stats["phases"] = {}
+            for timer in timers:
+                stats["phases"].update(timer.report())
+        return stats
+
+
+# used by callers that do not pass a context of their own, and by the pool workers, see get_default_context
+default_context = None
+
+
+def get_default_context():
+    # created by the first search that needs it, so importing the module allocates no transposition table
+    global default_context
+    if default_context is None:
+        default_context = SearchContext()
+    return default_context
+
+
+class PositionSnapshot:
+    # the parts of a game state from_game_state reads, cheap to send to a worker
+    def __init__(self, game_state):
+        self.board = [row[:] for row in game_state.board]
+        self.white_move = game_state.white_move
+        self.can_enpassant = game_state.can_enpassant
+        rights = game_state.curr_castling_rights
+        self.curr_castling_rights = CastleRights(rights.wk, rights.bk, rights.wq, rights.bq)
+        self.halfmove_clock = game_state.halfmove_clock
+        self.repetition_keys = game_state.repetition_keys
+
 
 def find_random_move(valid_moves):
     return random.choice(valid_moves)
 
-def find_best_move(game_state, valid_moves, return_queue):
-    global next_move
-    next_move = None
-    random.shuffle(valid_moves)
-    find_move_minmax(game_state, valid_moves, DEPTH, -CHECKMATE, CHECKMATE,
-                             1 if game_state.white_move else -1)
-    return_queue.put(next_move)
+def find_best_move(game_state, valid_moves, return_queue, backend=BACKEND, time_limit=TIME_LIMIT,
+                   node_limit=None, max_depth=MAX_DEPTH, workers=WORKERS, stop_event=None, use_book=True,
+                   context=None):
+    """
+    Iterative deepening driver.
+    Puts a dict for every finished iteration on return_queue and the best move of
+    the last finished iteration (or None) as the final item.
+    With more than one worker the root moves of every iteration are shared out over a process pool.
+    Setting stop_event ends the search early, like running out of time.
+    A book move is played without searching when use_book is set and the position is in the book.
+    context is the game's SearchContext, the default one when None.
+    """
+    if context is None:
+        context = get_default_context()
+    if use_book:
+        book = get_opening_book()
+        book_move = book.choose(game_state, valid_moves) if book is not None else None
+        if book_move is not None:
+            return_queue.put(book_move)
+            return
+    if PROFILER is not None:
+        with profiling.profiled(PROFILER, PROFILE_DIR):
+            iterative_deepening(context, game_state, valid_moves, return_queue, backend, time_limit, node_limit,
+                                max_depth, workers, stop_event)
+    else:
+        iterative_deepening(context, game_state, valid_moves, return_queue, backend, time_limit, node_limit,
+                            max_depth, workers, stop_event)
+
+
+def iterative_deepening(context, game_state, valid_moves, return_queue, backend, time_limit, node_limit, max_depth,
+                        workers, stop_event):
+    move_orderer = context.move_orderer
+    context.transposition_table.reset_stats()
+    move_orderer.new_search()
+    search_state = game_state
+    if backend in BACKENDS:
+        search_state = BACKENDS[backend].from_game_state(game_state)
+    # the search works on packed moves, the answer is the caller's Move so it can always be played on its board
+    caller_moves = {move.packed: move for move in valid_moves}
+    search_moves = [move for move in search_state.get_packed_moves() if move in caller_moves]
+    random.shuffle(search_moves)
+    turn_multiplier = 1 if game_state.white_move else -1
+
+    start_time = time.perf_counter()
+    context.start(len(search_state.hash_log), time_limit, node_limit, stop_event)
+    timers = []
+    if PHASE_TIMES:
+        timers = [profiling.PhaseTimer(search_state, SEARCH_PHASES),
+                  profiling.PhaseTimer(context, ("evaluate", "score_chess_board"))]
+    iterations = []
+    score = 0
+    best_move = None
+    for depth in range(1, max_depth + 1):
+        context.depth = depth
+        context.best_move = None
+        iteration_start = context.nodes
+        if workers > 1 and depth > 1 and len(search_moves) > 1:
+            score = search_root_parallel(context, search_state, search_moves, depth, turn_multiplier, backend,
+                                         workers)
+        else:
+            score = find_move_minmax(context, search_state, search_moves, depth, -CHECKMATE, CHECKMATE,
+                                     turn_multiplier)
+        if context.stopped or context.best_move is None:
+            break
+        best_move = context.best_move
+        # the next iteration starts with this one's best move
+        search_moves.remove(best_move)
+        search_moves.insert(0, best_move)
+        elapsed = time.perf_counter() - start_time
+        iterations.append({"depth": depth, "nodes": context.nodes - iteration_start, "time": round(elapsed, 6)})
+        pv = [Move.from_packed(move) for move in get_pv(context, search_state, depth)]
+        return_queue.put({"depth": depth, "score": score, "pv": [str(move) for move in pv],
+                          "pv_uci": [move.get_uci_notation() for move in pv],
+                          "nodes": context.nodes, "qnodes": context.quiescence_nodes, "time": elapsed,
+                          "nps": int(context.nodes / max(elapsed, 1e-6)), "cutoffs": move_orderer.cutoffs,
+                          "first_move_cutoff_rate": move_orderer.first_move_cutoff_rate(), "workers": workers})
+        if len(search_moves) == 1 or abs(score) >= MATE_THRESHOLD:
+            break
+        # the next iteration takes several times longer than this one
+        if time_limit is not None and elapsed * 2 > time_limit:
+            break
+        if node_limit is not None and context.nodes >= node_limit:
+            break
+        if stop_event is not None and stop_event.is_set():
+            break
+
+    for timer in timers:
+        timer.remove()
+    context.last_stats = context.search_stats(search_state, best_move, score, iterations,
+                                              time.perf_counter() - start_time, backend, workers, timers)
+    if STATS_PATH is not None:
+        with open(STATS_PATH, "a") as stats_file:
+            stats_file.write(json.dumps(context.last_stats) + "\n")
+    return_queue.put(caller_moves[best_move] if best_move is not None else None)
+
+
+def get_opening_book():
+    # opened once per process, the mapping is shared with every other process using the same file
+    global opening_book
+    if opening_book is None and BOOK_PATH and os.path.exists(BOOK_PATH):
+        opening_book = OpeningBook(BOOK_PATH)
+    return opening_book
+
+
+def new_game(context=None):
+    # forget everything learned about the previous game
+    context = context or default_context
+    # a default context not created yet has nothing to forget
+    if context is not None:
+        context.new_game()
+
+
+def get_worker_pool(workers):
+    global worker_pool, worker_pool_size, shared_alpha, shared_stop
+    if worker_pool is None or worker_pool_size != workers:
+        shutdown_worker_pool()
+        shared_alpha = multiprocessing.Value("i", -CHECKMATE)
+        shared_stop = multiprocessing.Event()
+        worker_pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=(shared_alpha, shared_stop))
+        worker_pool_size = workers
+    return worker_pool
+
 
-def find_move_minmax(game_state, valid_moves, depth, alpha, beta, turn_multiplier):
-    global next_move
+def shutdown_worker_pool():
+    global worker_pool, worker_pool_size
+    if worker_pool is not None:
+        worker_pool.terminate()
+        worker_pool.join()
+    worker_pool = None
+    worker_pool_size = 0
+
+
+def init_worker(alpha, stop):
+    global shared_alpha, shared_stop
+    shared_alpha = alpha
+    shared_stop = stop
+
+
+def search_root_parallel(context, search_state, search_moves, depth, turn_multiplier, backend, workers):
+    """
+    Root splitting: the first move is searched here to get a bound, the rest go to the pool one
+    move per task and start from the best score any process has found so far.
+    Every worker keeps its transposition and move ordering tables from task to task, across iterations
+    and searches, but it only learns about the root moves it happened to draw. A search on a fresh pool
+    therefore visits about twice the serial node count, and about the serial count once the tables are warm.
+    """
+    first_move = search_moves[0]
+    search_state.make_move(first_move)
+    best_score = -find_move_minmax(context, search_state, None, depth - 1,
+                                   -CHECKMATE, CHECKMATE, -turn_multiplier)
+    search_state.undo_move()
+    if context.stopped:
+        return 0
+    best_move = first_move
+
+    snapshot = PositionSnapshot(search_state)
+    time_left = context.deadline - time.perf_counter() if context.deadline is not None else None
+    node_budget = context.node_limit - context.nodes if context.node_limit is not None else None
+    tasks = [(snapshot, move, depth, backend, time_left, node_budget) for move in search_moves[1:]]
+    with pool_lock:
+        pool = get_worker_pool(workers)
+        shared_alpha.value = best_score
+        shared_stop.clear()
+        results = pool.imap_unordered(search_root_move, tasks)
+        for _ in tasks:
+            # the workers cannot see this search's stop event, so it is passed on to them through shared_stop
+            while True:
+                try:
+                    move, score, counters, stopped = results.next(POOL_POLL_INTERVAL)
+                    break
+                except multiprocessing.TimeoutError:
+                    if context.limit_reached():
+                        shared_stop.set()
+            context.add_counters(counters)
+            if stopped:
+                context.stopped = True
+            elif score > best_score:
+                best_score = score
+                best_move = move
+    if context.stopped:
+        return 0
+    context.best_move = best_move
+    context.transposition_table.store(search_state.zobrist_key, depth, best_score, EXACT, best_move)
+    return best_score
+
+
+def search_root_move(task):
+    # runs in a pool worker, whose default context keeps its tables warm between tasks
+    snapshot, move, depth, backend, time_left, node_budget = task
+    game_state = BACKENDS.get(backend, BitboardGameState).from_game_state(snapshot)
+    context = get_default_context()
+    context.start(len(game_state.hash_log), time_left, node_budget, shared_stop)
+    context.depth = depth
+    if shared_stop.is_set():
+        # the search was stopped while this move waited in the queue
+        return move, 0, context.counters(), True
+
+    alpha = shared_alpha.value
+    game_state.make_move(move)
+    turn_multiplier = 1 if game_state.white_move else -1
+    if PVS:
+        # like the serial root, a zero window first and the full one only for a move that beats alpha
+        score = -find_move_minmax(context, game_state, None, depth - 1, -alpha - ZERO_WINDOW, -alpha, turn_multiplier)
+        if score > alpha and not context.stopped:
+            context.re_searches += 1
+            score = -find_move_minmax(context, game_state, None, depth - 1, -CHECKMATE, -alpha, turn_multiplier)
+    else:
+        score = -find_move_minmax(context, game_state, None, depth - 1, -CHECKMATE, -alpha, turn_multiplier)
+    game_state.undo_move()
+    if not context.stopped and score > alpha:
+        with shared_alpha.get_lock():
+            if score > shared_alpha.value:
+                shared_alpha.value = score
+    return move, score, context.counters(), context.stopped
+
+
+def measure_parallel_speedup(game_state, depth=4, workers=None, backend=BACKEND):
+    """
+    Searches the position to a fixed depth serially and on the pool and compares the wall-clock times.
+    """
+    workers = workers or multiprocessing.cpu_count()
+    report = {"depth": depth, "workers": workers}
+    for mode, count in (("serial", 1), ("parallel", workers)):
+        get_default_context().transposition_table.clear()
+        shutdown_worker_pool()
+        if count > 1:
+            get_worker_pool(count)
+        results = QueueList()
+        start_time = time.perf_counter()
+        find_best_move(game_state, game_state.get_valid_moves(), results, backend=backend, time_limit=None,
+                       max_depth=depth, workers=count, use_book=False)
+        report[mode + "_time"] = time.perf_counter() - start_time
+        report[mode + "_nodes"] = results[-2]["nodes"] if len(results) > 1 else 0
+        report[mode + "_move"] = str(results[-1])
+    shutdown_worker_pool()
+    report["speedup"] = report["serial_time"] / max(report["parallel_time"], 1e-9)
+    return report
+
+
+class QueueList(list):
+    # stands in for the return queue when the results are read in the same process
+    def put(self, item):
+        self.append(item)
+
+
+def get_pv(context, game_state, depth):
+    # follow the best moves stored in the transposition table
+    transposition_table = context.transposition_table
+    pv = []
+    for _ in range(depth):
+        slot = transposition_table.probe(game_state.zobrist_key)
+        if slot == -1:
+            break
+        move = transposition_table.moves[slot]
+        if move not in game_state.get_packed_moves():
+            break
+        pv.append(move)
+        game_state.make_move(move)
+    for _ in pv:
+        game_state.undo_move()
+    return pv
+
+def find_move_minmax(context, game_state, valid_moves, depth, alpha, beta, turn_multiplier, allow_null=True):
+    context.nodes += 1
+    if context.nodes % NODE_CHECK_INTERVAL == 0 and context.limit_reached():
+        context.stopped = True
+    if context.stopped:
+        return 0
+    # the hash log also counts null moves
+    ply = len(game_state.hash_log) - context.root_ply
+    # one repetition is enough, the side that could avoid it would already have done so
+    if ply != 0 and (game_state.halfmove_clock >= FIFTY_MOVE_LIMIT or game_state.is_repetition()):
+        context.draws += 1
+        return DRAW
     if depth == 0:
-        return turn_multiplier * score_chess_board(game_state)
+        if QUIESCENCE:
+            return quiescence(context, game_state, alpha, beta, turn_multiplier)
+        # the mate and stalemate flags come from generating the moves
+        game_state.get_packed_moves()
+        if game_state.checkmate:
+            return ply - CHECKMATE
+        return turn_multiplier * context.score_chess_board(game_state)
+    transposition_table = context.transposition_table
+    move_orderer = context.move_orderer
+    key = game_state.zobrist_key
+    slot = transposition_table.probe(key)
+    hash_move = NO_MOVE
+    if slot != -1:
+        if ply != 0 and transposition_table.depths[slot] >= depth:
+            score = score_from_table(transposition_table.scores[slot], ply)
+            bound = transposition_table.bounds[slot]
+            if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+                return score
+        hash_move = transposition_table.moves[slot]
+    in_check = (NULL_MOVE or CHECK_EXTENSION or LMR) and game_state.in_check()
+    if CHECK_EXTENSION and in_check and ply < MAX_PLY:
+        depth += 1
+    if NULL_MOVE and allow_null and ply != 0 and not in_check and depth > NULL_MOVE_REDUCTION and \
+            abs(beta) < MATE_THRESHOLD and turn_multiplier * context.evaluate(game_state) >= beta and \
+            game_state.has_non_pawn_material():
+        game_state.make_null_move()
+        score = -find_move_minmax(context, game_state, None, depth - 1 - NULL_MOVE_REDUCTION, -beta, -beta + ZERO_WINDOW,
+                                  -turn_multiplier, False)
+        game_state.undo_null_move()
+        if context.stopped:
+            return 0
+        if score >= beta:
+            context.null_move_cutoffs += 1
+            return beta
+    white_move = game_state.white_move
+    if valid_moves is None and hasattr(game_state, "get_staged_moves"):
+        # hash move, captures, then quiets, each stage generated only when the one before fails to cut off
+        moves = game_state.get_staged_moves(hash_move, lambda batch: move_orderer.ordered(
+            batch, move_orderer.score_moves(batch, NO_MOVE, ply, white_move)))
+    else:
+        if valid_moves is None:
+            valid_moves = game_state.get_packed_moves()
+        moves = move_orderer.ordered(valid_moves, move_orderer.score_moves(valid_moves, hash_move, ply, white_move))
+    killers = move_orderer.killers[ply] if ply < MAX_PLY else ()
+    original_alpha = alpha
     max_score = -CHECKMATE
-    for move in valid_moves:
+    best_move = NO_MOVE
+    move_number = -1
+    for move_number, move in enumerate(moves):
         game_state.make_move(move)
-        next_moves = game_state.get_valid_moves()
-        score = -find_move_minmax(game_state, next_moves, depth - 1, -beta, -alpha, -turn_multiplier)
-        if score > max_score:
+        # children generate their own moves, after their transposition table probe
+        if move_number == 0 or not (PVS or LMR):
+            score = -find_move_minmax(context, game_state, None, depth - 1, -beta, -alpha, -turn_multiplier)
+        else:
+            reduction = 0
+            if LMR and depth >= LMR_MIN_DEPTH and move_number >= LMR_FULL_MOVES and not in_check and \
+                    move >> 16 & 15 == NO_PIECE and not move & PROMOTION and move not in killers:
+                reduction = 2 if move_number >= LMR_LATE_MOVES and depth > LMR_MIN_DEPTH else 1
+            # a zero window only proves the move is no better than alpha, a full one is needed without PVS
+            window = -alpha - ZERO_WINDOW if PVS else -beta
+            score = -find_move_minmax(context, game_state, None, depth - 1 - reduction, window, -alpha,
+                                      -turn_multiplier)
+            if reduction and score > alpha and not context.stopped:
+                context.re_searches += 1
+                score = -find_move_minmax(context, game_state, None, depth - 1, window, -alpha, -turn_multiplier)
+            if PVS and alpha < score < beta and not context.stopped:
+                context.re_searches += 1
+                score = -find_move_minmax(context, game_state, None, depth - 1, -beta, -alpha, -turn_multiplier)
+        # every move may lose to mate, the first one is still the best move until another scores higher
+        if score > max_score or best_move == NO_MOVE:
             max_score = score
-            if depth == DEPTH:
-                next_move = move
+            best_move = move
+            if ply == 0:
+                context.best_move = move
         game_state.undo_move()
+        if context.stopped:
+            return 0
         if max_score > alpha:
             alpha = max_score
         if alpha >= beta:
+            move_orderer.record_cutoff(move, move_number, depth, ply, white_move)
             break
+    if move_number == -1:
+        # no legal move, mate when in check and otherwise stalemate
+        return ply - CHECKMATE if in_check or game_state.in_check() else STALEMATE
+    if max_score <= original_alpha:
+        bound = UPPER
+    elif max_score >= beta:
+        bound = LOWER
+    else:
+        bound = EXACT
+    transposition_table.store(key, depth, score_to_table(max_score, ply), bound, best_move)
     return max_score
 
 
+def score_to_table(score, ply):
+    # the table keeps mate scores as distances from the stored position, which can be reached at any ply
+    if score >= MATE_THRESHOLD:
+        return score + ply
+    if score <= -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+
+def score_from_table(score, ply):
+    if score >= MATE_THRESHOLD:
+        return score - ply
+    if score <= -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+
+def quiescence(context, game_state, alpha, beta, turn_multiplier):
+    """
+    Searches captures and promotions until the position is quiet, so the static score is not
+    taken in the middle of an exchange. In check every evasion is searched and there is no stand pat.
+    """
+    context.nodes += 1
+    context.quiescence_nodes += 1
+    if context.nodes % NODE_CHECK_INTERVAL == 0 and context.limit_reached():
+        context.stopped = True
+    if context.stopped:
+        return 0
+    moves = game_state.get_capture_moves()
+    # the hash log also counts null moves
+    ply = len(game_state.hash_log) - context.root_ply
+    move_orderer = context.move_orderer
+    if game_state.is_in_check:
+        if not moves:
+            return ply - CHECKMATE
+        best_score = -CHECKMATE
+        stand_pat = None
+    else:
+        stand_pat = turn_multiplier * context.evaluate(game_state)
+        if stand_pat >= beta or ply >= MAX_PLY:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+        best_score = stand_pat
+    scores = move_orderer.score_moves(moves, NO_MOVE, ply, game_state.white_move)
+    for move in move_orderer.ordered(moves, scores):
+        # delta pruning: even winning the piece with room to spare would not lift the score to alpha
+        if stand_pat is not None and not move & PROMOTION and \
+                stand_pat + piece_number_centipawns[move >> 16 & 15] + DELTA_MARGIN <= alpha:
+            continue
+        game_state.make_move(move)
+        score = -quiescence(context, game_state, -beta, -alpha, -turn_multiplier)
+        game_state.undo_move()
+        if context.stopped:
+            return 0
+        if score > best_score:
+            best_score = score
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+    return best_score
+
+
 def score_chess_board(game_state):
     if game_state.checkmate:
         if game_state.white_move:
@@ -57,22 +634,9 @@ def score_chess_board(game_state):
             return CHECKMATE 
     elif game_state.stalemate:
         return STALEMATE
-    score = 0
-    for row in range(len(game_state.board)):
-        for col in range(len(game_state.board[row])):
-            piece = game_state.board[row][col]
-            if piece != "**":
-                piece_position_score = 0
-                if piece[1] != "K":
-                    piece_position_score = piece_position_values[piece][row][col]
-                if piece[0] == "w":
-                    score += ChessLib.piece_value_pos[piece[1]] + piece_position_score
-                if piece[0] == "b":
-                    score -= ChessLib.piece_value_pos[piece[1]] + piece_position_score
-
-    return score
-
-
-
+    return game_state.position_score
 
 
+if __name__ == "__main__":
+    import engine
+    print(measure_parallel_speedup(engine.GameState()))
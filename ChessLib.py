@@ -62,7 +62,27 @@ rook_values = [[0.2, 0.3, 0.3, 0.6, 0.6, 0.3, 0.3, 0.2],
                [0.2, 0.3, 0.5, 0.6, 0.6, 0.5, 0.3, 0.2]]
 
 
-
+# Packed moves, one int per move for the search and the move logs:
+# bits 0-5 start square and 6-11 end square (row * 8 + col), 12-15 piece moved,
+# 16-19 piece captured (NO_PIECE for none), then the flags below.
+# Promotions are always to a queen, so one flag is enough.
+piece_names = ["wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK"]
+NO_PIECE = 15
+piece_numbers = {name: number for number, name in enumerate(piece_names)}
+piece_numbers["**"] = NO_PIECE
+ENPASSANT = 1 << 20
+CASTLE = 1 << 21
+PROMOTION = 1 << 22
+# start and end square together, enough to tell the legal moves of a position apart
+SQUARES_MASK = 0xFFF
+# piece_value_pos by piece number, 0 for NO_PIECE
+piece_number_values = [piece_value_pos[name[1]] for name in piece_names] + [0] * (NO_PIECE + 1 - len(piece_names))
+# half moves without a capture or pawn move after which the game is drawn by the fifty-move rule
+FIFTY_MOVE_LIMIT = 100
+
+
+def pack_move(start, end, moved, captured, flags=0):
+    return start | end << 6 | moved << 12 | captured << 16 | flags
 
 
 class Move:
@@ -90,10 +110,38 @@ class Move:
 
         self.is_capture = self.piece_captured != "**"
         self.moveID = self.start_row * 1000 + self.start_col * 100 + self.end_row * 10 + self.end_col
+        self.packed = pack_move(self.start_row * 8 + self.start_col, self.end_row * 8 + self.end_col,
+                                piece_numbers[self.piece_moved], piece_numbers[self.piece_captured],
+                                (ENPASSANT if is_enpassant else 0) | (CASTLE if is_castle_move else 0) |
+                                (PROMOTION if self.is_pawn_promotion else 0))
+
+    @classmethod
+    def from_packed(cls, packed):
+        # the Move for display and notation, no board needed
+        move = cls.__new__(cls)
+        start = packed & 63
+        end = packed >> 6 & 63
+        move.start_row, move.start_col = start >> 3, start & 7
+        move.end_row, move.end_col = end >> 3, end & 7
+        move.piece_moved = piece_names[packed >> 12 & 15]
+        captured = packed >> 16 & 15
+        move.piece_captured = piece_names[captured] if captured != NO_PIECE else "**"
+        move.is_enpassant = bool(packed & ENPASSANT)
+        move.is_castle_move = bool(packed & CASTLE)
+        move.is_pawn_promotion = bool(packed & PROMOTION)
+        move.is_capture = captured != NO_PIECE
+        move.moveID = move.start_row * 1000 + move.start_col * 100 + move.end_row * 10 + move.end_col
+        move.packed = packed
+        return move
 
     def get_rank_file(self, row, col):
         return self.cols_to_files[col] + self.rows_to_ranks[row]
 
+    def get_uci_notation(self):
+        # long algebraic notation, e2e4, e1g1 for castling and e7e8q for a promotion
+        notation = self.get_rank_file(self.start_row, self.start_col) + self.get_rank_file(self.end_row, self.end_col)
+        return notation + "q" if self.is_pawn_promotion else notation
+
 
     #over write
     def __eq__(self, other):
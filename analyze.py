@@ -0,0 +1,190 @@
+"""
+Batch analysis of EPD and PGN files.
+Positions are streamed from the input files to a process pool and every result is written
+as one JSON line as soon as it is ready, so the corpus is never held in memory.
+
+python analyze.py positions.epd games.pgn --depth 4 --workers 8 --output results.jsonl
+"""
+import argparse
+import collections
+import json
+import multiprocessing
+import sys
+import time
+import ChessBot
+import fen
+import pgn
+from engine import GameState
+from transposition import TranspositionTable
+
+# tasks queued per worker, enough to keep every worker busy without reading far ahead
+TASKS_PER_WORKER = 4
+
+
+def read_tasks(paths):
+    # one task per EPD record and one per PGN game, (source, kind, payload)
+    for path in paths:
+        if path.lower().endswith(".pgn"):
+            for number, game in enumerate(pgn.read_games(path), 1):
+                yield path, "pgn", (number, game.headers, game.moves)
+        else:
+            with open(path) as epd_file:
+                for number, line in enumerate(epd_file, 1):
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        yield path, "epd", (number, line)
+
+
+def init_worker(hash_mb, backend, limits, min_ply):
+    global worker_context, worker_backend, worker_limits, worker_min_ply
+    worker_context = ChessBot.SearchContext(TranspositionTable(hash_mb))
+    worker_backend = backend
+    worker_limits = limits
+    worker_min_ply = min_ply
+
+
+def analyze_task(task):
+    """
+    Results for every position of the task, in order.
+    A position that cannot be read or searched gets an error record instead, so one bad
+    entry does not stop a run over a whole corpus.
+    """
+    source, kind, payload = task
+    results = []
+    if kind == "epd":
+        number, line = payload
+        try:
+            position, operations = fen.parse_epd(line)
+            result = analyze_position(GameState(position), worker_backend, worker_limits, worker_context)
+            if "id" in operations:
+                result["id"] = operations["id"].strip('"')
+            if "bm" in operations:
+                result["solved"] = best_move_found(position, operations["bm"], result["bestmove"])
+        except Exception as error:
+            result = {"error": error_text(error)}
+        result.update({"source": source, "line": number})
+        results.append(result)
+    else:
+        number, headers, moves = payload
+        ply = 0
+        try:
+            game = pgn.PgnGame(headers, moves, headers.get("Result", "*"))
+            for game_state, move in pgn.replay(game):
+                ply = len(game_state.move_log)
+                if ply < worker_min_ply:
+                    continue
+                try:
+                    result = analyze_position(game_state, worker_backend, worker_limits, worker_context)
+                except Exception as error:
+                    result = {"fen": game_state.to_fen(), "error": error_text(error)}
+                result.update({"source": source, "game": number, "ply": ply, "played": move.get_uci_notation()})
+                results.append(result)
+        except Exception as error:
+            # the rest of a game that cannot be replayed is skipped
+            results.append({"source": source, "game": number, "ply": ply, "error": error_text(error)})
+    return results
+
+
+def error_text(error):
+    return "%s: %s" % (type(error).__name__, error)
+
+
+def analyze_position(game_state, backend, limits, context=None):
+    valid_moves = game_state.get_valid_moves()
+    result = {"fen": game_state.to_fen()}
+    if not valid_moves:
+        result.update({"bestmove": None, "score": -ChessBot.CHECKMATE if game_state.checkmate else 0,
+                       "depth": 0, "nodes": 0, "time": 0.0, "pv": []})
+        return result
+    reports = ChessBot.QueueList()
+    start_time = time.perf_counter()
+    ChessBot.find_best_move(game_state, valid_moves, reports, backend=backend, workers=1, use_book=False,
+                            context=context, **limits)
+    elapsed = time.perf_counter() - start_time
+    best_move = reports[-1]
+    last = reports[-2] if len(reports) > 1 else {"score": 0, "depth": 0, "nodes": 0, "pv_uci": []}
+    result.update({"bestmove": best_move.get_uci_notation() if best_move else None,
+                   "score": last["score"], "depth": last["depth"], "nodes": last["nodes"],
+                   "time": round(elapsed, 4), "pv": last["pv_uci"]})
+    return result
+
+
+def best_move_found(position, best_moves, found):
+    # bm lists the right answers in SAN
+    game_state = GameState(position)
+    valid_moves = game_state.get_valid_moves()
+    for san in best_moves.split():
+        try:
+            if pgn.san_to_move(game_state, san, valid_moves).get_uci_notation() == found:
+                return True
+        except ValueError:
+            continue
+    return False
+
+
+def run(paths, output, workers, hash_mb, backend, limits, min_ply=0):
+    """
+    Analyzes every position in paths and writes one JSON line per position to output.
+    Returns a summary with the positions per second overall and per core.
+    """
+    positions = 0
+    start_time = time.perf_counter()
+    with multiprocessing.Pool(workers, initializer=init_worker,
+                              initargs=(hash_mb, backend, limits, min_ply)) as pool:
+        pending = collections.deque()
+        for task in read_tasks(paths):
+            pending.append((task, pool.apply_async(analyze_task, (task,))))
+            if len(pending) >= workers * TASKS_PER_WORKER:
+                positions += write_results(task_results(*pending.popleft()), output)
+        while pending:
+            positions += write_results(task_results(*pending.popleft()), output)
+    elapsed = time.perf_counter() - start_time
+    rate = positions / max(elapsed, 1e-9)
+    return {"positions": positions, "time": round(elapsed, 3), "workers": workers,
+            "positions_per_second": round(rate, 2), "positions_per_second_per_core": round(rate / workers, 2)}
+
+
+def task_results(task, pending_result):
+    # a task whose worker failed outside analyze_task's own error handling still gets its error record
+    try:
+        return pending_result.get()
+    except Exception as error:
+        source, kind, payload = task
+        return [{"source": source, "line" if kind == "epd" else "game": payload[0], "error": error_text(error)}]
+
+
+def write_results(results, output):
+    for result in results:
+        output.write(json.dumps(result) + "\n")
+    output.flush()
+    return len(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search every position of EPD and PGN files")
+    parser.add_argument("paths", nargs="+", help=".epd or .pgn files")
+    parser.add_argument("--depth", type=int, help="search depth, 3 when no limit is given")
+    parser.add_argument("--time", type=float, help="seconds per position")
+    parser.add_argument("--nodes", type=int, help="nodes per position")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--hash", type=int, default=ChessBot.TT_SIZE_MB, help="transposition table MB per worker")
+    parser.add_argument("--backend", choices=sorted(ChessBot.BACKENDS) + ["string"], default=ChessBot.BACKEND)
+    parser.add_argument("--min-ply", type=int, default=0, help="skip the first plies of every PGN game")
+    parser.add_argument("--output", help="JSONL file to write, standard output by default")
+    args = parser.parse_args(argv)
+    depth = args.depth
+    if depth is None and args.time is None and args.nodes is None:
+        depth = 3
+    limits = {"time_limit": args.time, "node_limit": args.nodes, "max_depth": depth or ChessBot.MAX_DEPTH}
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        summary = run(args.paths, output, args.workers, args.hash, args.backend, limits, args.min_ply)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    sys.stderr.write(json.dumps(summary) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,410 @@
+"""
+Bitboard backend for the engine.
+Every piece type is a 64 bit int with bit (row * 8 + col) set for each square it occupies,
+row 0 being the eighth rank like the string board.
+Knight, king and pawn attacks come from precomputed tables, sliding attacks from a
+kindergarten style lookup keyed by the occupancy of one line at a time.
+"""
+from ChessLib import Move, NO_PIECE, ENPASSANT, CASTLE, PROMOTION
+import zobrist
+from position_history import PositionHistory
+
+FULL = (1 << 64) - 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = 0, 1, 2, 3, 4, 5
+WHITE, BLACK = 0, 1
+
+# the piece indexes are the piece numbers of packed moves, NO_PIECE marks an empty square
+piece_names = ["wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK"]
+piece_index = {name: index for index, name in enumerate(piece_names)}
+piece_index["**"] = NO_PIECE
+# string board name of every piece index, NO_PIECE included
+square_names = piece_names + ["**"] * (NO_PIECE + 1 - len(piece_names))
+
+FILE_A = sum(1 << (row * 8) for row in range(8))
+FILE_H = FILE_A << 7
+row_masks = [0xFF << (row * 8) for row in range(8)]
+
+
+def bit_squares(bb):
+    # squares of the set bits, lowest first
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+def _offset_table(offsets):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        bb = 0
+        for d_row, d_col in offsets:
+            if 0 <= row + d_row <= 7 and 0 <= col + d_col <= 7:
+                bb |= 1 << ((row + d_row) * 8 + col + d_col)
+        table.append(bb)
+    return table
+
+
+knight_attacks = _offset_table(((-2, -1), (-2, 1), (-1, 2), (1, 2), (2, -1), (2, 1), (-1, -2), (1, -2)))
+king_attacks = _offset_table(((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)))
+# squares attacked by a pawn of the given color standing on the square
+pawn_attacks = [_offset_table(((-1, -1), (-1, 1))), _offset_table(((1, -1), (1, 1)))]
+
+
+def _ray(sq, d_row, d_col):
+    row, col = divmod(sq, 8)
+    squares = []
+    row, col = row + d_row, col + d_col
+    while 0 <= row <= 7 and 0 <= col <= 7:
+        squares.append(row * 8 + col)
+        row, col = row + d_row, col + d_col
+    return squares
+
+
+def _line_table(d_row, d_col):
+    # for one line through every square: the inner occupancy mask and a dict
+    # from each occupancy of that mask to the attacked squares along the line
+    masks = []
+    attacks = []
+    for sq in range(64):
+        rays = [_ray(sq, d_row, d_col), _ray(sq, -d_row, -d_col)]
+        mask = 0
+        for ray in rays:
+            for target in ray[:-1]:
+                mask |= 1 << target
+        table = {}
+        occupancy = 0
+        while True:
+            bb = 0
+            for ray in rays:
+                for target in ray:
+                    bb |= 1 << target
+                    if occupancy & (1 << target):
+                        break
+            table[occupancy] = bb
+            occupancy = (occupancy - mask) & mask
+            if occupancy == 0:
+                break
+        masks.append(mask)
+        attacks.append(table)
+    return masks, attacks
+
+
+rank_masks, rank_attacks = _line_table(0, 1)
+file_masks, file_attacks = _line_table(1, 0)
+diagonal_masks, diagonal_attacks = _line_table(1, 1)
+anti_diagonal_masks, anti_diagonal_attacks = _line_table(1, -1)
+
+
+def rook_attacks(sq, occupied):
+    return rank_attacks[sq][occupied & rank_masks[sq]] | file_attacks[sq][occupied & file_masks[sq]]
+
+
+def bishop_attacks(sq, occupied):
+    return diagonal_attacks[sq][occupied & diagonal_masks[sq]] | \
+        anti_diagonal_attacks[sq][occupied & anti_diagonal_masks[sq]]
+
+
+# between[a * 64 + b] holds the squares strictly between two aligned squares,
+# line[a * 64 + b] the whole line through them, both are 0 when they are not aligned
+between = [0] * 4096
+line = [0] * 4096
+for _sq in range(64):
+    for _d_row, _d_col in ((0, 1), (1, 0), (1, 1), (1, -1), (0, -1), (-1, 0), (-1, -1), (-1, 1)):
+        _full = 1 << _sq
+        for _target in _ray(_sq, _d_row, _d_col) + _ray(_sq, -_d_row, -_d_col):
+            _full |= 1 << _target
+        _gap = 0
+        for _target in _ray(_sq, _d_row, _d_col):
+            between[_sq * 64 + _target] = _gap
+            line[_sq * 64 + _target] = _full
+            _gap |= 1 << _target
+
+
+class BitboardGameState(PositionHistory):
+    def __init__(self, position=None):
+        # position is a fen.Position or another game state to start from, None is the initial position
+        position = self.initial_position(position)
+        self.set_board(position.board)
+        self.start_position(position, position.board)
+
+    def set_board(self, board):
+        self.pieces = [0] * 12
+        self.occupancy = [0, 0]
+        self.piece_at = [NO_PIECE] * 64
+        for row in range(8):
+            for col in range(8):
+                if board[row][col] != "**":
+                    self.put(row * 8 + col, piece_index[board[row][col]])
+
+    @property
+    def board(self):
+        # the 8x8 list of strings for drawing and FEN, built when asked for so make_move never writes it
+        piece_at = self.piece_at
+        return [[square_names[piece] for piece in piece_at[row * 8:row * 8 + 8]] for row in range(8)]
+
+    @property
+    def white_king_loc(self):
+        return divmod(self.pieces[KING].bit_length() - 1, 8)
+
+    @property
+    def black_king_loc(self):
+        return divmod(self.pieces[6 + KING].bit_length() - 1, 8)
+
+    def put(self, sq, piece):
+        bit = 1 << sq
+        self.pieces[piece] |= bit
+        self.occupancy[piece // 6] |= bit
+        self.piece_at[sq] = piece
+
+    def remove(self, sq):
+        piece = self.piece_at[sq]
+        bit = 1 << sq
+        self.pieces[piece] ^= bit
+        self.occupancy[piece // 6] ^= bit
+        self.piece_at[sq] = NO_PIECE
+        return piece
+
+    def enpassant_key(self):
+        # zobrist.enpassant_key from the pawn bitboards, hashed only when a pawn of the side to move can take
+        if self.can_enpassant == ():
+            return 0
+        row, col = self.can_enpassant
+        us = WHITE if self.white_move else BLACK
+        if pawn_attacks[1 - us][row * 8 + col] & self.pieces[6 * us + PAWN]:
+            return zobrist.enpassant_keys[col]
+        return 0
+
+    def make_move(self, move):
+        # move is packed, a Move from get_valid_moves is packed first
+        if not isinstance(move, int):
+            move = move.packed
+        enpassant_before = self.enpassant_key()
+        start = move & 63
+        end = move >> 6 & 63
+        if self.piece_at[end] != NO_PIECE:
+            self.remove(end)
+        piece = self.remove(start)
+        if move & PROMOTION:
+            self.put(end, piece - PAWN + QUEEN)
+        else:
+            self.put(end, piece)
+
+        if move & ENPASSANT:
+            self.remove((start & 56) | (end & 7))
+
+        if move & CASTLE:
+            if end - start == 2:
+                self.put(end - 1, self.remove(end + 1))
+            else:
+                self.put(end + 1, self.remove(end - 2))
+
+        self.push_move_state(move, enpassant_before)
+
+    def undo_move(self):
+        if len(self.move_log) != 0:
+            move = self.pop_move_state()
+            start = move & 63
+            end = move >> 6 & 63
+            captured = move >> 16 & 15
+            self.remove(end)
+            self.put(start, move >> 12 & 15)
+            if move & ENPASSANT:
+                self.put((start & 56) | (end & 7), captured)
+            elif captured != NO_PIECE:
+                self.put(end, captured)
+
+            if move & CASTLE:
+                if end - start == 2:
+                    self.put(end + 1, self.remove(end - 1))
+                else:
+                    self.put(end - 2, self.remove(end + 1))
+
+    def has_non_pawn_material(self):
+        # a knight, bishop, rook or queen of the side to move, passing is only safe with one
+        us = WHITE if self.white_move else BLACK
+        pieces = self.pieces
+        return self.occupancy[us] != pieces[6 * us + PAWN] | pieces[6 * us + KING]
+
+    def attackers_to(self, sq, color, occupied):
+        pieces = self.pieces
+        base = 6 * color
+        return (knight_attacks[sq] & pieces[base + KNIGHT]) | (king_attacks[sq] & pieces[base + KING]) | \
+            (pawn_attacks[1 - color][sq] & pieces[base + PAWN]) | \
+            (rook_attacks(sq, occupied) & (pieces[base + ROOK] | pieces[base + QUEEN])) | \
+            (bishop_attacks(sq, occupied) & (pieces[base + BISHOP] | pieces[base + QUEEN]))
+
+    def square_under_attack(self, row, col):
+        them = BLACK if self.white_move else WHITE
+        return self.attackers_to(row * 8 + col, them, self.occupancy[0] | self.occupancy[1]) != 0
+
+    def in_check(self):
+        us = WHITE if self.white_move else BLACK
+        king_sq = self.pieces[6 * us + KING].bit_length() - 1
+        return self.attackers_to(king_sq, 1 - us, self.occupancy[0] | self.occupancy[1]) != 0
+
+    def get_valid_moves(self):
+        # Move objects for display and notation, the search uses get_packed_moves
+        return [Move.from_packed(move) for move in self.get_packed_moves()]
+
+    def get_packed_moves(self):
+        us = WHITE if self.white_move else BLACK
+        them = 1 - us
+        pieces = self.pieces
+        piece_at = self.piece_at
+        own = self.occupancy[us]
+        enemy = self.occupancy[them]
+        occupied = own | enemy
+        base = 6 * us
+        king_sq = pieces[base + KING].bit_length() - 1
+        checkers = self.attackers_to(king_sq, them, occupied)
+        self.is_in_check = checkers != 0
+        moves = []
+
+        without_king = occupied ^ (1 << king_sq)
+        king_bits = king_sq | (base + KING) << 12
+        for end in bit_squares(king_attacks[king_sq] & ~own):
+            if not self.attackers_to(end, them, without_king):
+                moves.append(king_bits | end << 6 | piece_at[end] << 16)
+
+        if not checkers & (checkers - 1):
+            if checkers:
+                checker = checkers.bit_length() - 1
+                target_mask = checkers | between[king_sq * 64 + checker]
+            else:
+                target_mask = FULL
+            pinned = self.get_pinned(king_sq, us, occupied)
+            self.get_piece_moves(us, own, occupied, pinned, king_sq, target_mask, moves)
+            self.get_pawn_moves(us, enemy, occupied, pinned, king_sq, target_mask, moves)
+            if not checkers:
+                self.get_castle_moves(king_sq, us, occupied, moves)
+
+        if len(moves) == 0:
+            if self.is_in_check:
+                self.checkmate = True
+            else:
+                self.stalemate = True
+        else:
+            self.checkmate = False
+            self.stalemate = False
+        return moves
+
+    def get_capture_moves(self):
+        # packed legal captures and queen promotions for the quiescence search, every evasion when in check
+        us = WHITE if self.white_move else BLACK
+        them = 1 - us
+        own = self.occupancy[us]
+        enemy = self.occupancy[them]
+        occupied = own | enemy
+        king_sq = self.pieces[6 * us + KING].bit_length() - 1
+        self.is_in_check = self.attackers_to(king_sq, them, occupied) != 0
+        if self.is_in_check:
+            return self.get_packed_moves()
+        moves = []
+        piece_at = self.piece_at
+        king_bits = king_sq | (6 * us + KING) << 12
+        without_king = occupied ^ (1 << king_sq)
+        for end in bit_squares(king_attacks[king_sq] & enemy):
+            if not self.attackers_to(end, them, without_king):
+                moves.append(king_bits | end << 6 | piece_at[end] << 16)
+        pinned = self.get_pinned(king_sq, us, occupied)
+        self.get_piece_moves(us, own, occupied, pinned, king_sq, enemy, moves)
+        promotion_row = row_masks[0] if us == WHITE else row_masks[7]
+        self.get_pawn_moves(us, enemy, occupied, pinned, king_sq, enemy | promotion_row, moves)
+        return moves
+
+    def get_pinned(self, king_sq, us, occupied):
+        pieces = self.pieces
+        own = self.occupancy[us]
+        base = 6 * (1 - us)
+        enemy = self.occupancy[1 - us]
+        snipers = (rook_attacks(king_sq, enemy) & (pieces[base + ROOK] | pieces[base + QUEEN])) | \
+                  (bishop_attacks(king_sq, enemy) & (pieces[base + BISHOP] | pieces[base + QUEEN]))
+        pinned = 0
+        for sniper in bit_squares(snipers):
+            blockers = between[king_sq * 64 + sniper] & occupied
+            if blockers and not blockers & (blockers - 1) and blockers & own:
+                pinned |= blockers
+        return pinned
+
+    def get_piece_moves(self, us, own, occupied, pinned, king_sq, target_mask, moves):
+        pieces = self.pieces
+        piece_at = self.piece_at
+        base = 6 * us
+        not_own = ~own & target_mask
+        for piece in (KNIGHT, BISHOP, ROOK, QUEEN):
+            for start in bit_squares(pieces[base + piece]):
+                if piece == KNIGHT:
+                    if pinned >> start & 1:
+                        continue
+                    targets = knight_attacks[start]
+                elif piece == BISHOP:
+                    targets = bishop_attacks(start, occupied)
+                elif piece == ROOK:
+                    targets = rook_attacks(start, occupied)
+                else:
+                    targets = rook_attacks(start, occupied) | bishop_attacks(start, occupied)
+                targets &= not_own
+                if pinned >> start & 1:
+                    targets &= line[king_sq * 64 + start]
+                start_bits = start | (base + piece) << 12
+                for end in bit_squares(targets):
+                    moves.append(start_bits | end << 6 | piece_at[end] << 16)
+
+    def get_pawn_moves(self, us, enemy, occupied, pinned, king_sq, target_mask, moves):
+        piece_at = self.piece_at
+        pawn = 6 * us + PAWN
+        pawns = self.pieces[pawn]
+        empty = ~occupied & FULL
+        if us == WHITE:
+            forward = -8
+            single = (pawns >> 8) & empty
+            double = ((single & row_masks[5]) >> 8) & empty
+            left = ((pawns & ~FILE_A) >> 9) & enemy
+            right = ((pawns & ~FILE_H) >> 7) & enemy
+        else:
+            forward = 8
+            single = (pawns << 8) & empty
+            double = ((single & row_masks[2]) << 8) & empty
+            left = ((pawns & ~FILE_A) << 7) & enemy & FULL
+            right = ((pawns & ~FILE_H) << 9) & enemy & FULL
+        for targets, step in ((single, forward), (double, 2 * forward), (left, forward - 1), (right, forward + 1)):
+            for end in bit_squares(targets & target_mask):
+                start = end - step
+                if pinned >> start & 1 and not line[king_sq * 64 + start] >> end & 1:
+                    continue
+                move = start | end << 6 | pawn << 12 | piece_at[end] << 16
+                if end < 8 or end >= 56:
+                    move |= PROMOTION
+                moves.append(move)
+
+        if self.can_enpassant != ():
+            end = self.can_enpassant[0] * 8 + self.can_enpassant[1]
+            captured = end - forward
+            them = 1 - us
+            pieces = self.pieces
+            base = 6 * them
+            for start in bit_squares(pawn_attacks[them][end] & pawns):
+                # play it out on the occupancy, the captured pawn can uncover a rank attack
+                after = occupied ^ (1 << start) ^ (1 << end) ^ (1 << captured)
+                if rook_attacks(king_sq, after) & (pieces[base + ROOK] | pieces[base + QUEEN]) or \
+                        bishop_attacks(king_sq, after) & (pieces[base + BISHOP] | pieces[base + QUEEN]) or \
+                        knight_attacks[king_sq] & pieces[base + KNIGHT] or \
+                        pawn_attacks[us][king_sq] & pieces[base + PAWN] & ~(1 << captured):
+                    continue
+                moves.append(start | end << 6 | pawn << 12 | (base + PAWN) << 16 | ENPASSANT)
+
+    def get_castle_moves(self, king_sq, us, occupied, moves):
+        rights = self.curr_castling_rights
+        them = 1 - us
+        king_bits = king_sq | (6 * us + KING) << 12 | NO_PIECE << 16 | CASTLE
+        king_side = rights.wk if us == WHITE else rights.bk
+        queen_side = rights.wq if us == WHITE else rights.bq
+        if king_side and not occupied & (0b11 << (king_sq + 1)):
+            if not self.attackers_to(king_sq + 1, them, occupied) and \
+                    not self.attackers_to(king_sq + 2, them, occupied):
+                moves.append(king_bits | (king_sq + 2) << 6)
+        if queen_side and not occupied & (0b111 << (king_sq - 3)):
+            if not self.attackers_to(king_sq - 1, them, occupied) and \
+                    not self.attackers_to(king_sq - 2, them, occupied):
+                moves.append(king_bits | (king_sq - 2) << 6)
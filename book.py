@@ -0,0 +1,182 @@
+"""
+Opening book in the Polyglot file format.
+A book is a file of 16 byte entries (key, move, weight, learn), big endian and sorted by key.
+It is memory-mapped and binary searched, so opening it costs nothing and every engine
+process shares the same pages through the OS cache.
+The keys come from zobrist.py, which uses the Polyglot random numbers, so books built
+by other Polyglot tools can be used as well as those built with build_book.
+
+python book.py build games.pgn --output book.bin --max-ply 16
+python book.py probe "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+"""
+import argparse
+import mmap
+import random
+import struct
+import sys
+import pgn
+from engine import GameState
+
+entry_struct = struct.Struct(">QHHI")
+key_struct = struct.Struct(">Q")
+ENTRY_SIZE = entry_struct.size
+MAX_WEIGHT = 0xFFFF
+
+
+def encode_move(move):
+    # Polyglot move: to file, to rank, from file, from rank in 3 bits each, rank 0 is the first rank
+    # castling is written as the king taking its own rook
+    end_col = move.end_col
+    if move.is_castle_move:
+        end_col = 7 if move.end_col == 6 else 0
+    encoded = end_col | (7 - move.end_row) << 3 | move.start_col << 6 | (7 - move.start_row) << 9
+    if move.is_pawn_promotion:
+        encoded |= 4 << 12
+    return encoded
+
+
+def decode_move(encoded, valid_moves):
+    # the legal move the book entry stands for, or None
+    end_col = encoded & 7
+    end_row = 7 - (encoded >> 3 & 7)
+    start_col = encoded >> 6 & 7
+    start_row = 7 - (encoded >> 9 & 7)
+    promotion = encoded >> 12 & 7
+    if promotion not in (0, 4):
+        # only queen promotions exist in this engine
+        return None
+    for move in valid_moves:
+        if move.start_row != start_row or move.start_col != start_col:
+            continue
+        if move.end_row == end_row and move.end_col == end_col:
+            return move
+        if move.is_castle_move and move.end_row == end_row and (
+                (end_col == 7 and move.end_col == 6) or (end_col == 0 and move.end_col == 2)):
+            return move
+    return None
+
+
+class OpeningBook:
+    def __init__(self, path):
+        self.path = path
+        self.book_file = open(path, "rb")
+        self.entry_count = 0
+        self.data = None
+        size = self.book_file.seek(0, 2)
+        if size >= ENTRY_SIZE:
+            self.data = mmap.mmap(self.book_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.entry_count = size // ENTRY_SIZE
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+        self.book_file.close()
+
+    def first_index(self, key):
+        # binary search for the first entry whose key is not below key
+        low = 0
+        high = self.entry_count
+        data = self.data
+        while low < high:
+            middle = (low + high) // 2
+            if key_struct.unpack_from(data, middle * ENTRY_SIZE)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def entries(self, key):
+        # (move, weight, learn) of every entry for key
+        found = []
+        index = self.first_index(key)
+        while index < self.entry_count:
+            entry_key, move, weight, learn = entry_struct.unpack_from(self.data, index * ENTRY_SIZE)
+            if entry_key != key:
+                break
+            found.append((move, weight, learn))
+            index += 1
+        return found
+
+    def moves(self, game_state, valid_moves=None):
+        # (move, weight) for the legal book moves of the position
+        if valid_moves is None:
+            valid_moves = game_state.get_valid_moves()
+        book_moves = []
+        for encoded, weight, _ in self.entries(game_state.zobrist_key):
+            move = decode_move(encoded, valid_moves)
+            if move is not None:
+                book_moves.append((move, weight))
+        return book_moves
+
+    def choose(self, game_state, valid_moves=None, generator=random):
+        # a book move picked with probability proportional to its weight, or None when out of book
+        book_moves = [(move, weight) for move, weight in self.moves(game_state, valid_moves) if weight > 0]
+        if not book_moves:
+            return None
+        pick = generator.uniform(0, sum(weight for _, weight in book_moves))
+        for move, weight in book_moves:
+            pick -= weight
+            if pick <= 0:
+                return move
+        return book_moves[-1][0]
+
+
+def build_book(pgn_paths, output_path, max_ply=16, min_games=1):
+    """
+    Compiles a book from PGN games.
+    Every move of the first max_ply plies scores 2 for a win of the side that played it, 1 for a draw
+    and 0 for a loss, and moves played in fewer than min_games games are left out.
+    Returns the number of entries written.
+    """
+    scores = {}
+    games = {}
+    for path in pgn_paths:
+        for game in pgn.read_games(path):
+            for game_state, move in pgn.replay(game):
+                if len(game_state.move_log) >= max_ply:
+                    break
+                entry = (game_state.zobrist_key, encode_move(move))
+                if game.result == "1/2-1/2":
+                    score = 1
+                elif game.result == ("1-0" if game_state.white_move else "0-1"):
+                    score = 2
+                else:
+                    score = 0
+                scores[entry] = scores.get(entry, 0) + score
+                games[entry] = games.get(entry, 0) + 1
+    kept = [entry for entry in scores if games[entry] >= min_games]
+    top_score = max([scores[entry] for entry in kept] + [1])
+    # scale down so the best move still fits in 16 bits
+    scale = min(1.0, MAX_WEIGHT / top_score)
+    kept.sort(key=lambda entry: (entry[0], -scores[entry]))
+    with open(output_path, "wb") as book_file:
+        for key, move in kept:
+            book_file.write(entry_struct.pack(key, move, int(scores[(key, move)] * scale), 0))
+    return len(kept)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or inspect a Polyglot format opening book")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="compile a book from PGN files")
+    build.add_argument("paths", nargs="+")
+    build.add_argument("--output", default="book.bin")
+    build.add_argument("--max-ply", type=int, default=16)
+    build.add_argument("--min-games", type=int, default=1)
+    probe = commands.add_parser("probe", help="list the book moves of a position")
+    probe.add_argument("fen")
+    probe.add_argument("--book", default="book.bin")
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        print("%d entries written to %s" % (build_book(args.paths, args.output, args.max_ply, args.min_games),
+                                            args.output))
+    else:
+        book = OpeningBook(args.book)
+        for move, weight in book.moves(GameState.from_fen(args.fen)):
+            print(move.get_uci_notation(), weight)
+        book.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
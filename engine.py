@@ -2,156 +2,310 @@
 Storing information about the current state of the game
 Determines valid moves.
 """
-from ChessLib import Move, chess_board, CastleRights
-import copy
-
-class GameState:
-    def __init__(self):
+from ChessLib import Move, pack_move, piece_names, piece_numbers, NO_PIECE, ENPASSANT, CASTLE, PROMOTION, \
+    FIFTY_MOVE_LIMIT
+import zobrist
+from position_history import PositionHistory
+from transposition import NO_MOVE
+
+# which moves the generators produce, promotions and en passant count as captures
+CAPTURES = 1
+QUIETS = 2
+ALL_MOVES = CAPTURES | QUIETS
+
+
+def step_squares(row, col, steps):
+    return tuple((row + d_row, col + d_col) for d_row, d_col in steps
+                 if 0 <= row + d_row <= 7 and 0 <= col + d_col <= 7)
+
+
+def ray_squares(row, col, d_row, d_col):
+    squares = []
+    row, col = row + d_row, col + d_col
+    while 0 <= row <= 7 and 0 <= col <= 7:
+        squares.append((row, col))
+        row, col = row + d_row, col + d_col
+    return tuple(squares)
+
+
+# attack lookups by square, [row][col] -> (row, col) squares, so an attack test walks rays instead of generating moves
+knight_steps = ((-2, -1), (-2, 1), (-1, 2), (1, 2), (2, -1), (2, 1), (-1, -2), (1, -2))
+king_steps = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+# rook directions first, then bishop directions
+ray_directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+knight_squares = [[step_squares(row, col, knight_steps) for col in range(8)] for row in range(8)]
+king_squares = [[step_squares(row, col, king_steps) for col in range(8)] for row in range(8)]
+square_rays = [[tuple(ray_squares(row, col, d_row, d_col) for d_row, d_col in ray_directions)
+                for col in range(8)] for row in range(8)]
+
+
+def pack_board_move(board, row, col, end_row, end_col, flags=0):
+    # the packed move from (row, col) to (end_row, end_col) on a string board
+    moved = piece_numbers[board[row][col]]
+    if flags & ENPASSANT:
+        # the other colour's pawn, which is not on the end square
+        captured = 6 - moved
+    else:
+        captured = piece_numbers[board[end_row][end_col]]
+        if moved % 6 == 0 and (end_row == 0 or end_row == 7):
+            flags |= PROMOTION
+    return pack_move(row * 8 + col, end_row * 8 + end_col, moved, captured, flags)
+
+
+class GameState(PositionHistory):
+    def __init__(self, position=None, move_cache=None):
         # The chess board is a 2d list
         # ** represents an empty square
-        self.board = copy.deepcopy(chess_board)
+        # position is a fen.Position or another game state to start from, None is the initial position
+        # move_cache is an optional move_cache.MoveCache that get_packed_moves answers from
+        position = self.initial_position(position)
+        self.board = [row[:] for row in position.board]
         self.move_methods = {"p": self.get_pawn_moves, "R": self.get_rook_moves, "N": self.get_knight_moves,
                               "B": self.get_bishop_moves, "Q": self.get_queen_moves, "K": self.get_king_moves}
 
         self.white_king_loc = (7, 4)
         self.black_king_loc = (0, 4)
-        self.checkmate = False
-        self.stalemate = False
-        self.is_in_check = False
-        self.white_move = True
-        self.can_enpassant = ()
-        self.enpassant_log = [self.can_enpassant]
-        self.move_log = []
-        self.curr_castling_rights = CastleRights(True, True, True, True)
-        self.castle_rights_log = [CastleRights(self.curr_castling_rights.wk, self.curr_castling_rights.bk,
-                                               self.curr_castling_rights.wq, self.curr_castling_rights.bq)]
-        self.pins = []
-        self.checks = []
-
-
-    def get_possible_moves(self):
+        for row in range(8):
+            if "wK" in self.board[row]:
+                self.white_king_loc = (row, self.board[row].index("wK"))
+            if "bK" in self.board[row]:
+                self.black_king_loc = (row, self.board[row].index("bK"))
+        self.pins = ()
+        self.checks = ()
+        # pin direction of every square for the side to move, None when not pinned, reused from node to node
+        self.pin_directions = [None] * 64
+        self.pinned_squares = []
+        self.evasion_squares = [False] * 64
+        self.move_cache = move_cache
+        self.start_position(position, self.board)
+
+    def draw_reason(self):
+        # "threefold repetition" or "fifty-move rule" once the game is drawn by one of them, else None
+        if self.is_repetition(2):
+            return "threefold repetition"
+        if self.halfmove_clock >= FIFTY_MOVE_LIMIT and not self.checkmate:
+            return "fifty-move rule"
+        return None
+
+    def get_possible_moves(self, kinds=ALL_MOVES):
         moves = []
         for row in range(len(self.board)):
             for col in range(len(self.board[row])):
                 turn = self.board[row][col][0]
                 if (turn == "w" and self.white_move) or (turn == "b" and not self.white_move):
                     piece = self.board[row][col][1]
-                    self.move_methods[piece](row, col, moves)
+                    self.move_methods[piece](row, col, moves, kinds)
         return moves
 
-    def make_move(self, move):
-        self.board[move.end_row][move.end_col] = move.piece_moved
-        self.board[move.start_row][move.start_col] = "**"
-        self.move_log.append(move)
-        self.white_move = not self.white_move
-
-        if move.piece_moved == "wK":
-            self.white_king_loc = (move.end_row, move.end_col)
-        elif move.piece_moved == "bK":
-            self.black_king_loc = (move.end_row, move.end_col)
-
-        if move.is_pawn_promotion:
-            self.board[move.end_row][move.end_col] = move.piece_moved[0] + "Q"
+    def enpassant_key(self):
+        return zobrist.enpassant_key(self.board, self.can_enpassant, self.white_move)
 
-        if move.is_enpassant:
-            self.board[move.start_row][move.end_col] = "**"
-
-        if move.piece_moved[1] == "p" and abs(move.start_row - move.end_row) == 2:
-            self.can_enpassant = ((move.start_row + move.end_row) // 2, move.start_col)
-        else:
-            self.can_enpassant = ()
+    def make_move(self, move):
+        # move is packed, a Move from get_valid_moves is packed first
+        if not isinstance(move, int):
+            move = move.packed
+        enpassant_before = self.enpassant_key()
+        start = move & 63
+        end = move >> 6 & 63
+        start_row, start_col = start >> 3, start & 7
+        end_row, end_col = end >> 3, end & 7
+        piece_moved = piece_names[move >> 12 & 15]
+        self.board[end_row][end_col] = piece_moved
+        self.board[start_row][start_col] = "**"
+
+        if piece_moved == "wK":
+            self.white_king_loc = (end_row, end_col)
+        elif piece_moved == "bK":
+            self.black_king_loc = (end_row, end_col)
+
+        if move & PROMOTION:
+            self.board[end_row][end_col] = piece_moved[0] + "Q"
+
+        if move & ENPASSANT:
+            self.board[start_row][end_col] = "**"
 
         # castle
-        if move.is_castle_move:
-            if move.end_col - move.start_col == 2:
-                self.board[move.end_row][move.end_col - 1] = self.board[move.end_row][
-                    move.end_col + 1]
-                self.board[move.end_row][move.end_col + 1] = '**'
+        if move & CASTLE:
+            if end_col - start_col == 2:
+                self.board[end_row][end_col - 1] = self.board[end_row][end_col + 1]
+                self.board[end_row][end_col + 1] = '**'
             else:
-                self.board[move.end_row][move.end_col + 1] = self.board[move.end_row][
-                    move.end_col - 2]
-                self.board[move.end_row][move.end_col - 2] = '**'
+                self.board[end_row][end_col + 1] = self.board[end_row][end_col - 2]
+                self.board[end_row][end_col - 2] = '**'
 
-        self.enpassant_log.append(self.can_enpassant)
-
-        self.update_castle_rights(move)
-        self.castle_rights_log.append(CastleRights(self.curr_castling_rights.wk, self.curr_castling_rights.bk,
-                                                   self.curr_castling_rights.wq, self.curr_castling_rights.bq))
+        self.push_move_state(move, enpassant_before)
 
     def undo_move(self):
         if len(self.move_log) != 0:
-            move = self.move_log.pop()
-            self.board[move.start_row][move.start_col] = move.piece_moved
-            self.board[move.end_row][move.end_col] = move.piece_captured
-            self.white_move = not self.white_move
-            if move.piece_moved == "wK":
-                self.white_king_loc = (move.start_row, move.start_col)
-            elif move.piece_moved == "bK":
-                self.black_king_loc = (move.start_row, move.start_col)
-            if move.is_enpassant:
-                self.board[move.end_row][move.end_col] = "**"
-                self.board[move.start_row][move.end_col] = move.piece_captured
-
-            self.enpassant_log.pop()
-            self.can_enpassant = self.enpassant_log[-1]
-
-            self.castle_rights_log.pop()
-            self.curr_castling_rights = self.castle_rights_log[
-                -1]
-            if move.is_castle_move:
-                if move.end_col - move.start_col == 2:
-                    self.board[move.end_row][move.end_col + 1] = self.board[move.end_row][move.end_col - 1]
-                    self.board[move.end_row][move.end_col - 1] = '**'
+            move = self.pop_move_state()
+            start = move & 63
+            end = move >> 6 & 63
+            start_row, start_col = start >> 3, start & 7
+            end_row, end_col = end >> 3, end & 7
+            piece_moved = piece_names[move >> 12 & 15]
+            captured = move >> 16 & 15
+            piece_captured = piece_names[captured] if captured != NO_PIECE else "**"
+            self.board[start_row][start_col] = piece_moved
+            self.board[end_row][end_col] = piece_captured
+            if piece_moved == "wK":
+                self.white_king_loc = (start_row, start_col)
+            elif piece_moved == "bK":
+                self.black_king_loc = (start_row, start_col)
+            if move & ENPASSANT:
+                self.board[end_row][end_col] = "**"
+                self.board[start_row][end_col] = piece_captured
+
+            if move & CASTLE:
+                if end_col - start_col == 2:
+                    self.board[end_row][end_col + 1] = self.board[end_row][end_col - 1]
+                    self.board[end_row][end_col - 1] = '**'
                 else:
-                    self.board[move.end_row][move.end_col - 2] = self.board[move.end_row][move.end_col + 1]
-                    self.board[move.end_row][move.end_col + 1] = '**'
-            self.checkmate = False
-            self.stalemate = False
+                    self.board[end_row][end_col - 2] = self.board[end_row][end_col + 1]
+                    self.board[end_row][end_col + 1] = '**'
 
     def get_valid_moves(self):
-        temp_castle_rights = CastleRights(self.curr_castling_rights.wk, self.curr_castling_rights.bk,
-                                          self.curr_castling_rights.wq, self.curr_castling_rights.bq)
-        moves = []
-        self.is_in_check, self.pins, self.checks = self.check_pins_and_checks()
+        # Move objects for display and notation, the search uses get_packed_moves
+        return [Move.from_packed(move) for move in self.get_packed_moves()]
+
+    def get_packed_moves(self):
+        move_cache = self.move_cache
+        if move_cache is not None:
+            entry = move_cache.get(self.hash_log[-1])
+            if entry is not None:
+                moves, self.checkmate, self.stalemate, self.is_in_check = entry
+                return list(moves)
+        self.set_pins_and_checks(*self.check_pins_and_checks())
+        return self.generate_legal_moves()
+
+    def generate_legal_moves(self):
+        # every legal move once set_pins_and_checks has run, stored in the move cache when there is one
+        moves = self.generate_moves(ALL_MOVES)
+        self.set_game_over(moves)
+        if self.move_cache is not None:
+            self.move_cache.put(self.hash_log[-1], moves, self.checkmate, self.stalemate, self.is_in_check)
+        return moves
 
+    def get_capture_moves(self):
+        # packed captures and promotions for the quiescence search, every evasion when in check
+        self.set_pins_and_checks(*self.check_pins_and_checks())
+        if self.is_in_check:
+            return self.generate_legal_moves()
+        return self.generate_moves(CAPTURES)
+
+    def set_pins_and_checks(self, is_in_check, pins, checks):
+        # what check_pins_and_checks found, pins also go into pin_directions for the piece generators
+        pin_directions = self.pin_directions
+        for square in self.pinned_squares:
+            pin_directions[square] = None
+        del self.pinned_squares[:]
+        for row, col, d_row, d_col in pins:
+            pin_directions[row * 8 + col] = (d_row, d_col)
+            self.pinned_squares.append(row * 8 + col)
+        self.is_in_check = is_in_check
+        self.pins = pins
+        self.checks = checks
+
+    def get_staged_moves(self, hash_move=NO_MOVE, order=None):
+        """
+        Yields the legal packed moves in stages: the hash move, then captures and promotions, then quiet moves.
+        Each stage is only generated once the previous one has been used up, so a node that cuts off
+        on the hash move or a capture never generates its quiet moves.
+        order, if given, takes each stage's list and returns it as an iterable in search order.
+        The checkmate and stalemate flags are set once the last stage turns out empty.
+        """
+        # pin and check info is worked out once, the search below us overwrites it between stages
+        in_check, pins, checks = self.check_pins_and_checks()
+        found = False
+        first = None
+        if hash_move != NO_MOVE:
+            self.set_pins_and_checks(in_check, pins, checks)
+            first = self.get_hash_move(hash_move)
+            if first is not None:
+                found = True
+                yield first
+        for kinds in (CAPTURES, QUIETS):
+            self.set_pins_and_checks(in_check, pins, checks)
+            moves = self.generate_moves(kinds)
+            if first is not None:
+                moves = [move for move in moves if move != first]
+            if order is not None and len(moves) > 1:
+                moves = order(moves)
+            for move in moves:
+                found = True
+                yield move
+        self.checkmate = not found and in_check
+        self.stalemate = not found and not in_check
+
+    def get_hash_move(self, hash_move):
+        # hash_move if it is legal here, generating only the moves of the piece on its start square
+        start_row = (hash_move & 63) >> 3
+        start_col = hash_move & 7
+        piece = self.board[start_row][start_col]
+        if piece[0] != ("w" if self.white_move else "b"):
+            return None
+        moves = []
+        if piece[1] == "K":
+            self.get_king_moves(start_row, start_col, moves)
+            if not self.is_in_check:
+                self.get_castle_moves(start_row, start_col, moves)
+        elif len(self.checks) < 2:
+            self.move_methods[piece[1]](start_row, start_col, moves, ALL_MOVES)
+            if self.is_in_check:
+                moves = self.filter_check_evasions(moves)
+        return hash_move if hash_move in moves else None
+
+    def generate_moves(self, kinds):
+        # legal moves of the given kinds, set_pins_and_checks must have been called for this position
         if self.white_move:
-            king_row = self.white_king_loc[0]
-            king_col = self.white_king_loc[1]
+            king_row, king_col = self.white_king_loc
         else:
-            king_row = self.black_king_loc[0]
-            king_col = self.black_king_loc[1]
+            king_row, king_col = self.black_king_loc
         if self.is_in_check:
             if len(self.checks) == 1:
-                moves = self.get_possible_moves()
-                check = self.checks[0]
-                check_row = check[0]
-                check_col = check[1]
-                piece_checking = self.board[check_row][check_col]
-                valid_squares = []
-                if piece_checking[1] == "N":
-                    valid_squares = [(check_row, check_col)]
-                else:
-                    for i in range(1, 8):
-                        valid_square = (king_row + check[2] * i,
-                                        king_col + check[3] * i)
-                        valid_squares.append(valid_square)
-                        if valid_square[0] == check_row and valid_square[
-                            1] == check_col:
-                            break
-                for i in range(len(moves) - 1, -1, -1):
-                    if moves[i].piece_moved[1] != "K":
-                        if not (moves[i].end_row,
-                                moves[i].end_col) in valid_squares:
-                            moves.remove(moves[i])
+                moves = self.filter_check_evasions(self.get_possible_moves(kinds))
             else:
-                self.get_king_moves(king_row, king_col, moves)
+                moves = []
+                self.get_king_moves(king_row, king_col, moves, kinds)
         else:
-            moves = self.get_possible_moves()
-            if self.white_move:
-                self.get_castle_moves(self.white_king_loc[0], self.white_king_loc[1], moves)
-            else:
-                self.get_castle_moves(self.black_king_loc[0], self.black_king_loc[1], moves)
+            moves = self.get_possible_moves(kinds)
+            if kinds & QUIETS:
+                self.get_castle_moves(king_row, king_col, moves)
+        return moves
 
+    def filter_check_evasions(self, moves):
+        # keeps king moves and the moves that capture or block the single checking piece
+        if self.white_move:
+            king_row, king_col = self.white_king_loc
+        else:
+            king_row, king_col = self.black_king_loc
+        check = self.checks[0]
+        check_row = check[0]
+        check_col = check[1]
+        piece_checking = self.board[check_row][check_col]
+        # squares as row * 8 + col, like the packed moves, flagged in a map reused by every call
+        checker_square = check_row * 8 + check_col
+        evasion_squares = self.evasion_squares
+        if piece_checking[1] == "N":
+            valid_squares = (checker_square,)
+        else:
+            valid_squares = []
+            for end_row, end_col in square_rays[king_row][king_col][ray_directions.index((check[2], check[3]))]:
+                valid_squares.append(end_row * 8 + end_col)
+                if end_row == check_row and end_col == check_col:
+                    break
+        for square in valid_squares:
+            evasion_squares[square] = True
+        evasions = []
+        for move in moves:
+            if (move >> 12 & 15) % 6 == 5 or evasion_squares[move >> 6 & 63] or (
+                    # en passant can take a checking pawn without landing on its square
+                    move & ENPASSANT and ((move & 63) & 56) | (move >> 6 & 7) == checker_square):
+                evasions.append(move)
+        for square in valid_squares:
+            evasion_squares[square] = False
+        return evasions
+
+    def set_game_over(self, moves):
         if len(moves) == 0:
             if self.in_check():
                 self.checkmate = True
@@ -161,119 +315,102 @@ class GameState:
             self.checkmate = False
             self.stalemate = False
 
-        self.curr_castling_rights = temp_castle_rights
-        return moves
-
     def in_check(self):
         if self.white_move:
             return self.square_under_attack(self.white_king_loc[0], self.white_king_loc[1])
         else:
             return self.square_under_attack(self.black_king_loc[0], self.black_king_loc[1])
 
-    def update_castle_rights(self, move):
-        if move.piece_captured == "wR":
-            if move.end_col == 0:
-                self.curr_castling_rights.wq = False
-            elif move.end_col == 7:
-                self.curr_castling_rights.wk = False
-        elif move.piece_captured == "bR":
-            if move.end_col == 0:
-                self.curr_castling_rights.bq = False
-            elif move.end_col == 7:
-                self.curr_castling_rights.bk = False
-
-        if move.piece_moved == 'wK':
-            self.curr_castling_rights.wq = False
-            self.curr_castling_rights.wk = False
-        elif move.piece_moved == 'bK':
-            self.curr_castling_rights.bq = False
-            self.curr_castling_rights.bk = False
-        elif move.piece_moved == 'wR':
-            if move.start_row == 7:
-                if move.start_col == 0:
-                    self.curr_castling_rights.wq = False
-                elif move.start_col == 7:
-                    self.curr_castling_rights.wk = False
-        elif move.piece_moved == 'bR':
-            if move.start_row == 0:
-                if move.start_col == 0:
-                    self.curr_castling_rights.bq = False
-                elif move.start_col == 7:
-                    self.curr_castling_rights.bk = False
+    def has_non_pawn_material(self):
+        # a knight, bishop, rook or queen of the side to move, passing is only safe with one
+        color = "w" if self.white_move else "b"
+        for row in self.board:
+            for piece in row:
+                if piece[0] == color and piece[1] != "p" and piece[1] != "K":
+                    return True
+        return False
 
     def square_under_attack(self, row, col):
-        self.white_move = not self.white_move
-        opponents_moves = self.get_possible_moves()
-        self.white_move = not self.white_move
-        for move in opponents_moves:
-            if move.end_row == row and move.end_col == col:
+        return self.attacked_by(row, col, "b" if self.white_move else "w")
+
+    def attacked_by(self, row, col, color):
+        # looks outwards from the square for a piece of color that attacks it
+        board = self.board
+        knight = color + "N"
+        for end_row, end_col in knight_squares[row][col]:
+            if board[end_row][end_col] == knight:
+                return True
+        king = color + "K"
+        for end_row, end_col in king_squares[row][col]:
+            if board[end_row][end_col] == king:
+                return True
+        # white pawns attack upwards, so an attacking white pawn stands one row below
+        pawn_row = row + 1 if color == "w" else row - 1
+        if 0 <= pawn_row <= 7:
+            pawn = color + "p"
+            if (col > 0 and board[pawn_row][col - 1] == pawn) or (col < 7 and board[pawn_row][col + 1] == pawn):
                 return True
+        queen = color + "Q"
+        for index, ray in enumerate(square_rays[row][col]):
+            slider = color + ("R" if index < 4 else "B")
+            for end_row, end_col in ray:
+                piece = board[end_row][end_col]
+                if piece != "**":
+                    if piece == slider or piece == queen:
+                        return True
+                    break
         return False
 
-
     def check_pins_and_checks(self):
-        pins = []
-        checks = []
+        # walks the precomputed rays and knight squares around the king of the side to move
+        # pins and checks are tuples that stay the shared empty one unless something is found, so the usual
+        # position allocates nothing, and get_staged_moves can keep them while the search below runs
+        pins = ()
+        checks = ()
         is_in_check = False
+        board = self.board
         if self.white_move:
             enemy_color = "b"
             friendly_color = "w"
-            start_row = self.white_king_loc[0]
-            start_col = self.white_king_loc[1]
+            start_row, start_col = self.white_king_loc
         else:
             enemy_color = "w"
             friendly_color = "b"
-            start_row = self.black_king_loc[0]
-            start_col = self.black_king_loc[1]
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
-        for j in range(len(directions)):
-            direction = directions[j]
+            start_row, start_col = self.black_king_loc
+        for j, ray in enumerate(square_rays[start_row][start_col]):
+            direction = ray_directions[j]
             possible_pin = ()
-            for i in range(1, 8):
-                end_row = start_row + direction[0] * i
-                end_col = start_col + direction[1] * i
-                if 0 <= end_row <= 7 and 0 <= end_col <= 7:
-                    end_piece = self.board[end_row][end_col]
-                    if end_piece[0] == friendly_color and end_piece[1] != "K":
+            distance = 0
+            for end_row, end_col in ray:
+                distance += 1
+                end_piece = board[end_row][end_col]
+                if end_piece == "**":
+                    continue
+                if end_piece[0] == friendly_color:
+                    if end_piece[1] == "K" or possible_pin != ():
+                        break
+                    possible_pin = (end_row, end_col, direction[0], direction[1])
+                else:
+                    enemy_type = end_piece[1]
+                    if (j <= 3 and enemy_type == "R") or (4 <= j and enemy_type == "B") or (
+                            distance == 1 and enemy_type == "p" and (
+                            (enemy_color == "w" and 6 <= j) or (enemy_color == "b" and 4 <= j <= 5))) or (
+                            enemy_type == "Q") or (distance == 1 and enemy_type == "K"):
                         if possible_pin == ():
-                            possible_pin = (end_row, end_col, direction[0], direction[1])
-                        else:
-                            break
-                    elif end_piece[0] == enemy_color:
-                        enemy_type = end_piece[1]
-                        if (0 <= j <= 3 and enemy_type == "R") or (4 <= j <= 7 and enemy_type == "B") or (
-                                i == 1 and enemy_type == "p" and (
-                                (enemy_color == "w" and 6 <= j <= 7) or (enemy_color == "b" and 4 <= j <= 5))) or (
-                                enemy_type == "Q") or (i == 1 and enemy_type == "K"):
-                            if possible_pin == ():
-                                is_in_check = True
-                                checks.append((end_row, end_col, direction[0], direction[1]))
-                                break
-                            else:
-                                pins.append(possible_pin)
-                                break
+                            is_in_check = True
+                            checks += ((end_row, end_col, direction[0], direction[1]),)
                         else:
-                            break
-                else:
+                            pins += (possible_pin,)
                     break
-        knight_moves = ((-2, -1), (-2, 1), (-1, 2), (1, 2), (2, -1), (2, 1), (-1, -2), (1, -2))
-        for move in knight_moves:
-            end_row = start_row + move[0]
-            end_col = start_col + move[1]
-            if 0 <= end_row <= 7 and 0 <= end_col <= 7:
-                end_piece = self.board[end_row][end_col]
-                if end_piece[0] == enemy_color and end_piece[1] == "N":
-                    is_in_check = True
-                    checks.append((end_row, end_col, move[0], move[1]))
+        knight = enemy_color + "N"
+        for end_row, end_col in knight_squares[start_row][start_col]:
+            if board[end_row][end_col] == knight:
+                is_in_check = True
+                checks += ((end_row, end_col, end_row - start_row, end_col - start_col),)
         return is_in_check, pins, checks
 
-    def get_knight_moves(self, row, col, moves):
-        piece_pinned = False
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piece_pinned = True
-                self.pins.remove(self.pins[i])
-                break
+    def get_knight_moves(self, row, col, moves, kinds=ALL_MOVES):
+        piece_pinned = self.pin_directions[row * 8 + col] is not None
         #L shaped
         knight_moves = ((-2, -1), (-2, 1), (-1, 2), (1, 2), (2, -1), (2, 1), (-1, -2),
                         (1, -2))
@@ -284,18 +421,12 @@ class GameState:
             if 0 <= end_row <= 7 and 0 <= end_col <= 7:
                 if not piece_pinned:
                     end_piece = self.board[end_row][end_col]
-                    if end_piece[0] != friendly_color:
-                        moves.append(Move((row, col), (end_row, end_col), self.board))
-
-    def get_pawn_moves(self, row, col, moves):
-        piece_pinned = False
-        pin_direction = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-                self.pins.remove(self.pins[i])
-                break
+                    if end_piece[0] != friendly_color and kinds & (QUIETS if end_piece == "**" else CAPTURES):
+                        moves.append(pack_board_move(self.board, row, col, end_row, end_col))
+
+    def get_pawn_moves(self, row, col, moves, kinds=ALL_MOVES):
+        pin_direction = self.pin_directions[row * 8 + col]
+        piece_pinned = pin_direction is not None
 
         if self.white_move:
             move_amount = -1
@@ -309,14 +440,16 @@ class GameState:
             king_row, king_col = self.black_king_loc
 
         if self.board[row + move_amount][col] == "**":
-            if not piece_pinned or pin_direction == (move_amount, 0):
-                moves.append(Move((row, col), (row + move_amount, col), self.board))
-                if row == start_row and self.board[row + 2 * move_amount][col] == "**":
-                    moves.append(Move((row, col), (row + 2 * move_amount, col), self.board))
-        if col - 1 >= 0:
+            if not piece_pinned or pin_direction == (move_amount, 0) or pin_direction == (-move_amount, 0):
+                promotion = row + move_amount == 0 or row + move_amount == 7
+                if kinds & (CAPTURES if promotion else QUIETS):
+                    moves.append(pack_board_move(self.board, row, col, row + move_amount, col))
+                if kinds & QUIETS and row == start_row and self.board[row + 2 * move_amount][col] == "**":
+                    moves.append(pack_board_move(self.board, row, col, row + 2 * move_amount, col))
+        if col - 1 >= 0 and kinds & CAPTURES:
             if not piece_pinned or pin_direction == (move_amount, -1):
                 if self.board[row + move_amount][col - 1][0] == enemy_color:
-                    moves.append(Move((row, col), (row + move_amount, col - 1), self.board))
+                    moves.append(pack_board_move(self.board, row, col, row + move_amount, col - 1))
                 if (row + move_amount, col - 1) == self.can_enpassant:
                     attacking_piece = blocking_piece = False
                     if king_row == row:
@@ -333,14 +466,16 @@ class GameState:
                             square = self.board[row][i]
                             if square[0] == enemy_color and (square[1] == "R" or square[1] == "Q"):
                                 attacking_piece = True
+                                break
                             elif square != "**":
                                 blocking_piece = True
+                                break
                     if not attacking_piece or blocking_piece:
-                        moves.append(Move((row, col), (row + move_amount, col - 1), self.board, is_enpassant=True))
-        if col + 1 <= 7:
+                        moves.append(pack_board_move(self.board, row, col, row + move_amount, col - 1, ENPASSANT))
+        if col + 1 <= 7 and kinds & CAPTURES:
             if not piece_pinned or pin_direction == (move_amount, +1):
                 if self.board[row + move_amount][col + 1][0] == enemy_color:
-                    moves.append(Move((row, col), (row + move_amount, col + 1), self.board))
+                    moves.append(pack_board_move(self.board, row, col, row + move_amount, col + 1))
                 if (row + move_amount, col + 1) == self.can_enpassant:
                     attacking_piece = blocking_piece = False
                     if king_row == row:
@@ -357,22 +492,16 @@ class GameState:
                             square = self.board[row][i]
                             if square[0] == enemy_color and (square[1] == "R" or square[1] == "Q"):
                                 attacking_piece = True
+                                break
                             elif square != "**":
                                 blocking_piece = True
+                                break
                     if not attacking_piece or blocking_piece:
-                        moves.append(Move((row, col), (row + move_amount, col + 1), self.board, is_enpassant=True))
-
-    def get_rook_moves(self, row, col, moves):
-        piece_pinned = False
-        pin_direction = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-                if self.board[row][col][
-                    1] != "Q":
-                    self.pins.remove(self.pins[i])
-                break
+                        moves.append(pack_board_move(self.board, row, col, row + move_amount, col + 1, ENPASSANT))
+
+    def get_rook_moves(self, row, col, moves, kinds=ALL_MOVES):
+        pin_direction = self.pin_directions[row * 8 + col]
+        piece_pinned = pin_direction is not None
 
         directions = ((-1, 0), (0, -1), (1, 0), (0, 1))
         enemy_color = "b" if self.white_move else "w"
@@ -385,9 +514,11 @@ class GameState:
                             -direction[0], -direction[1]):
                         end_piece = self.board[end_row][end_col]
                         if end_piece == "**":
-                            moves.append(Move((row, col), (end_row, end_col), self.board))
+                            if kinds & QUIETS:
+                                moves.append(pack_board_move(self.board, row, col, end_row, end_col))
                         elif end_piece[0] == enemy_color:
-                            moves.append(Move((row, col), (end_row, end_col), self.board))
+                            if kinds & CAPTURES:
+                                moves.append(pack_board_move(self.board, row, col, end_row, end_col))
                             break
                         else:
                             break
@@ -395,15 +526,9 @@ class GameState:
                     break
 
 
-    def get_bishop_moves(self, row, col, moves):
-        piece_pinned = False
-        pin_direction = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-                self.pins.remove(self.pins[i])
-                break
+    def get_bishop_moves(self, row, col, moves, kinds=ALL_MOVES):
+        pin_direction = self.pin_directions[row * 8 + col]
+        piece_pinned = pin_direction is not None
 
         directions = ((-1, -1), (-1, 1), (1, 1), (1, -1))
         enemy_color = "b" if self.white_move else "w"
@@ -416,9 +541,11 @@ class GameState:
                             -direction[0], -direction[1]):
                         end_piece = self.board[end_row][end_col]
                         if end_piece == "**":
-                            moves.append(Move((row, col), (end_row, end_col), self.board))
+                            if kinds & QUIETS:
+                                moves.append(pack_board_move(self.board, row, col, end_row, end_col))
                         elif end_piece[0] == enemy_color:
-                            moves.append(Move((row, col), (end_row, end_col), self.board))
+                            if kinds & CAPTURES:
+                                moves.append(pack_board_move(self.board, row, col, end_row, end_col))
                             break
                         else:
                             break
@@ -426,32 +553,25 @@ class GameState:
                     break
 
 
-    def get_king_moves(self, row, col, moves):
-        row_moves = (-1, -1, -1, 0, 0, 1, 1, 1)
-        col_moves = (-1, 0, 1, -1, 1, -1, 0, 1)
+    def get_king_moves(self, row, col, moves, kinds=ALL_MOVES):
+        board = self.board
         friendly_color = "w" if self.white_move else "b"
-        for i in range(8):
-            end_row = row + row_moves[i]
-            end_col = col + col_moves[i]
-            if 0 <= end_row <= 7 and 0 <= end_col <= 7:
-                end_piece = self.board[end_row][end_col]
-                if end_piece[0] != friendly_color:
-                    if friendly_color == "w":
-                        self.white_king_loc = (end_row, end_col)
-                    else:
-                        self.black_king_loc = (end_row, end_col)
-                    is_in_check, pins, checks = self.check_pins_and_checks()
-                    if not is_in_check:
-                        moves.append(Move((row, col), (end_row, end_col), self.board))
-                    if friendly_color == "w":
-                        self.white_king_loc = (row, col)
-                    else:
-                        self.black_king_loc = (row, col)
-
-    def get_queen_moves(self, row, col, moves):
+        enemy_color = "b" if self.white_move else "w"
+        # lift the king off the board, so it cannot step back along a checking ray
+        king = board[row][col]
+        board[row][col] = "**"
+        for end_row, end_col in king_squares[row][col]:
+            end_piece = board[end_row][end_col]
+            if end_piece[0] != friendly_color and kinds & (QUIETS if end_piece == "**" else CAPTURES):
+                if not self.attacked_by(end_row, end_col, enemy_color):
+                    moves.append(pack_move(row * 8 + col, end_row * 8 + end_col, piece_numbers[king],
+                                           piece_numbers[end_piece]))
+        board[row][col] = king
+
+    def get_queen_moves(self, row, col, moves, kinds=ALL_MOVES):
         # use previous methods
-        self.get_bishop_moves(row, col, moves)
-        self.get_rook_moves(row, col, moves)
+        self.get_rook_moves(row, col, moves, kinds)
+        self.get_bishop_moves(row, col, moves, kinds)
 
     def get_castle_moves(self, row, col, moves):
         if self.square_under_attack(row, col):
@@ -468,12 +588,12 @@ class GameState:
     def get_king_castle_moves(self, row, col, moves):
         if self.board[row][col + 1] == '**' and self.board[row][col + 2] == '**':
             if not self.square_under_attack(row, col + 1) and not self.square_under_attack(row, col + 2):
-                moves.append(Move((row, col), (row, col + 2), self.board, is_castle_move=True))
+                moves.append(pack_board_move(self.board, row, col, row, col + 2, CASTLE))
 
     def get_queen_castle_moves(self, row, col, moves):
         if self.board[row][col - 1] == '**' and self.board[row][col - 2] == '**' and self.board[row][col - 3] == '**':
             if not self.square_under_attack(row, col - 1) and not self.square_under_attack(row, col - 2):
-                moves.append(Move((row, col), (row, col - 2), self.board, is_castle_move=True))
+                moves.append(pack_board_move(self.board, row, col, row, col - 2, CASTLE))
 
 
 
@@ -0,0 +1,97 @@
+"""
+Long-lived engine process for the GUI.
+The process keeps its game state, transposition table and history tables between moves,
+the GUI talks to it through a command queue and reads search reports from a result queue.
+"""
+import atexit
+from multiprocessing import Process, Queue, Event
+from queue import Empty
+import engine
+import ChessBot
+
+
+class EngineService:
+    def __init__(self):
+        self.commands = Queue()
+        self.results = Queue()
+        self.stop_event = Event()
+        self.search_id = 0
+        self.process = Process(target=service_loop, args=(self.commands, self.results, self.stop_event))
+        self.process.start()
+        # the pool workers of a parallel search need a non-daemon process, so shut it down ourselves
+        atexit.register(self.close)
+
+    def set_position(self, move_log):
+        # the position is sent as the list of packed moves played from the start
+        self.commands.put(("position", list(move_log)))
+
+    def go(self, **limits):
+        # limits are find_best_move keywords: time_limit, node_limit, max_depth, workers
+        self.search_id += 1
+        self.commands.put(("go", (self.search_id, limits)))
+        return self.search_id
+
+    def stop(self):
+        self.stop_event.set()
+
+    def new_game(self):
+        self.stop_event.set()
+        self.commands.put(("newgame", None))
+
+    def poll(self):
+        # next (search_id, item) from the engine or None, item is a report dict or the final move
+        try:
+            return self.results.get_nowait()
+        except Empty:
+            return None
+
+    def close(self):
+        if self.process.is_alive():
+            self.stop_event.set()
+            self.commands.put(("quit", None))
+            self.process.join(5)
+            if self.process.is_alive():
+                self.process.terminate()
+
+
+class TaggedQueue:
+    # marks everything a search reports with its id so the GUI can drop answers it no longer wants
+    def __init__(self, queue, search_id):
+        self.queue = queue
+        self.search_id = search_id
+
+    def put(self, item):
+        self.queue.put((self.search_id, item))
+
+
+def set_position(game_state, moves):
+    # undo back to the common start and play the rest, usually only the last one or two moves change
+    played = game_state.move_log
+    common = 0
+    while common < len(played) and common < len(moves) and played[common] == moves[common]:
+        common += 1
+    for _ in range(len(played) - common):
+        game_state.undo_move()
+    for move in moves[common:]:
+        game_state.make_move(move)
+
+
+def service_loop(commands, results, stop_event):
+    game_state = engine.GameState()
+    context = ChessBot.SearchContext()
+    while True:
+        command, args = commands.get()
+        if command == "position":
+            set_position(game_state, args)
+        elif command == "go":
+            search_id, limits = args
+            stop_event.clear()
+            valid_moves = game_state.get_valid_moves()
+            ChessBot.find_best_move(game_state, valid_moves, TaggedQueue(results, search_id),
+                                    stop_event=stop_event, context=context, **limits)
+        elif command == "newgame":
+            game_state = engine.GameState()
+            context.new_game()
+        elif command == "quit":
+            ChessBot.shutdown_worker_pool()
+            break
@@ -0,0 +1,74 @@
+"""
+Material and piece-square scores from white's point of view, in integer centipawns.
+The game states keep the total up to date move by move, so reading it at a leaf is O(1).
+Integers add up exactly however many moves are made and taken back, to_pawns is only for display.
+"""
+import ChessLib
+from ChessLib import piece_names, piece_number_values, NO_PIECE, ENPASSANT, CASTLE, PROMOTION
+
+CENTIPAWNS = 100
+
+piece_position_values = {"wB": ChessLib.bishop_values,
+                         "bB": ChessLib.bishop_values[::-1],
+                         "wN": ChessLib.knight_values,
+                         "bN": ChessLib.knight_values[::-1],
+                         "wR": ChessLib.rook_values,
+                         "bR": ChessLib.rook_values[::-1],
+                         "wp": ChessLib.pawn_values,
+                         "bp": ChessLib.pawn_values[::-1],
+                         "wQ": ChessLib.queen_values,
+                         "bQ": ChessLib.queen_values[::-1]
+                         }
+
+# piece_square_scores["wN"][row * 8 + col] in centipawns, negative for black pieces
+piece_square_scores = {}
+for _color in "wb":
+    for _kind in ChessLib.piece_value_pos:
+        _piece = _color + _kind
+        _sign = 1 if _color == "w" else -1
+        piece_square_scores[_piece] = [
+            _sign * round(CENTIPAWNS * (ChessLib.piece_value_pos[_kind] +
+                                        (piece_position_values[_piece][sq // 8][sq % 8] if _kind != "K" else 0)))
+            for sq in range(64)]
+# the same lists by packed move piece number
+number_scores = [piece_square_scores[name] for name in piece_names]
+# material by packed move piece number, 0 for NO_PIECE
+piece_number_centipawns = [CENTIPAWNS * value for value in piece_number_values]
+
+
+def to_pawns(score):
+    return score / CENTIPAWNS
+
+
+def board_score(board):
+    score = 0
+    for row in range(8):
+        for col, piece in enumerate(board[row]):
+            if piece != "**":
+                score += piece_square_scores[piece][row * 8 + col]
+    return score
+
+
+def move_score(move):
+    # change of board_score made by a packed move
+    start = move & 63
+    end = move >> 6 & 63
+    moved_number = move >> 12 & 15
+    captured = move >> 16 & 15
+    moved = number_scores[moved_number]
+    if move & PROMOTION:
+        # moved is a pawn, its queen is four piece numbers on
+        delta = number_scores[moved_number + 4][end] - moved[start]
+    else:
+        delta = moved[end] - moved[start]
+    if move & ENPASSANT:
+        delta -= number_scores[captured][(start & 56) | (end & 7)]
+    elif captured != NO_PIECE:
+        delta -= number_scores[captured][end]
+    if move & CASTLE:
+        rook = number_scores[moved_number - 2]
+        if end - start == 2:
+            delta += rook[end - 1] - rook[end + 1]
+        else:
+            delta += rook[end + 1] - rook[end - 2]
+    return delta
@@ -0,0 +1,200 @@
+"""
+FEN and EPD reading and writing.
+A parsed record is a Position, which carries the same attribute names as a game state,
+so every board representation can be built straight from it without replaying moves.
+"""
+from ChessLib import CastleRights, Move
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+fen_pieces = {"P": "wp", "N": "wN", "B": "wB", "R": "wR", "Q": "wQ", "K": "wK",
+              "p": "bp", "n": "bN", "b": "bB", "r": "bR", "q": "bQ", "k": "bK"}
+piece_letters = {piece: letter for letter, piece in fen_pieces.items()}
+# a run of empty squares, "3" -> ["**", "**", "**"]
+empty_runs = {str(count): ["**"] * count for count in range(1, 9)}
+
+
+class Position:
+    # board, side to move, castling rights, en passant square and move counters
+    def __init__(self, board, white_move, curr_castling_rights, can_enpassant, halfmove_clock=0, fullmove_number=1):
+        self.board = board
+        self.white_move = white_move
+        self.curr_castling_rights = curr_castling_rights
+        self.can_enpassant = can_enpassant
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+
+
+# parsed ranks, a corpus repeats the same few hundred rank strings over and over
+rank_cache = {}
+
+
+def parse_rank(rank):
+    row = []
+    for char in rank:
+        if char in fen_pieces:
+            row.append(fen_pieces[char])
+        elif char in empty_runs:
+            row.extend(empty_runs[char])
+        else:
+            raise ValueError("bad FEN rank: " + rank)
+    if len(row) != 8:
+        raise ValueError("bad FEN rank: " + rank)
+    if len(rank_cache) < 100000:
+        rank_cache[rank] = row
+    return row
+
+
+def parse_board(text):
+    board = []
+    for rank in text.split("/"):
+        row = rank_cache.get(rank)
+        board.append(row[:] if row is not None else parse_rank(rank)[:])
+    if len(board) != 8:
+        raise ValueError("bad FEN board: " + text)
+    return board
+
+
+def parse_fields(fields):
+    # the four fields FEN and EPD share: board, side to move, castling and en passant
+    if len(fields) < 4:
+        raise ValueError("FEN needs at least four fields: " + " ".join(fields))
+    if fields[1] not in ("w", "b"):
+        raise ValueError("bad side to move: " + fields[1])
+    board = parse_board(fields[0])
+    white_move = fields[1] == "w"
+    castling = fields[2]
+    # a right whose king or rook is off its home square cannot be used, whatever the FEN says
+    white_king = board[7][4] == "wK"
+    black_king = board[0][4] == "bK"
+    rights = CastleRights("K" in castling and white_king and board[7][7] == "wR",
+                          "k" in castling and black_king and board[0][7] == "bR",
+                          "Q" in castling and white_king and board[7][0] == "wR",
+                          "q" in castling and black_king and board[0][0] == "bR")
+    enpassant = fields[3]
+    if enpassant == "-":
+        can_enpassant = ()
+    elif enpassant[0] in Move.files_to_cols and enpassant[1:] in ("3", "6"):
+        can_enpassant = (Move.ranks_to_rows[enpassant[1]], Move.files_to_cols[enpassant[0]])
+        row, col = can_enpassant
+        # the square is only kept behind a pawn of the side not to move that has just made a double step
+        if white_move:
+            pawn_row, pawn, expected_row = row + 1, "bp", 2
+        else:
+            pawn_row, pawn, expected_row = row - 1, "wp", 5
+        if row != expected_row or board[pawn_row][col] != pawn or board[row][col] != "**":
+            can_enpassant = ()
+    else:
+        raise ValueError("bad en passant square: " + enpassant)
+    return Position(board, white_move, rights, can_enpassant)
+
+
+def parse_fen(text):
+    fields = text.split()
+    position = parse_fields(fields)
+    if len(fields) > 4:
+        position.halfmove_clock = int(fields[4])
+    if len(fields) > 5:
+        position.fullmove_number = int(fields[5])
+    return position
+
+
+def parse_epd(line):
+    """
+    Splits an EPD record into a Position and its operations.
+    Operations map opcode to the operand text as written, quotes included, e.g. {"bm": "Nf3", "id": '"WAC.001"'}.
+    """
+    fields = line.split(None, 4)
+    position = parse_fields(fields)
+    operations = {}
+    if len(fields) > 4:
+        for operation in split_operations(fields[4]):
+            opcode, _, operand = operation.partition(" ")
+            operations[opcode] = operand.strip()
+    if "hmvc" in operations:
+        position.halfmove_clock = int(operations["hmvc"])
+    if "fmvn" in operations:
+        position.fullmove_number = int(operations["fmvn"])
+    return position, operations
+
+
+def split_operations(text):
+    # semicolons inside quoted operands do not end an operation
+    operations = []
+    current = ""
+    quoted = False
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        if char == ";" and not quoted:
+            if current.strip():
+                operations.append(current.strip())
+            current = ""
+        else:
+            current += char
+    if current.strip():
+        operations.append(current.strip())
+    return operations
+
+
+def read_epd(path):
+    # yields (position, operations) for every record in an EPD file
+    with open(path) as epd_file:
+        for line in epd_file:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield parse_epd(line)
+
+
+def board_fen(board):
+    ranks = []
+    for row in board:
+        rank = ""
+        empty = 0
+        for piece in row:
+            if piece == "**":
+                empty += 1
+            else:
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece_letters[piece]
+        if empty:
+            rank += str(empty)
+        ranks.append(rank)
+    return "/".join(ranks)
+
+
+def castling_fen(rights):
+    text = ("K" if rights.wk else "") + ("Q" if rights.wq else "") + ("k" if rights.bk else "") + (
+        "q" if rights.bq else "")
+    return text or "-"
+
+
+def enpassant_fen(can_enpassant):
+    if not can_enpassant:
+        return "-"
+    return Move.cols_to_files[can_enpassant[1]] + Move.rows_to_ranks[can_enpassant[0]]
+
+
+def epd_fields(game_state):
+    return " ".join((board_fen(game_state.board), "w" if game_state.white_move else "b",
+                     castling_fen(game_state.curr_castling_rights), enpassant_fen(game_state.can_enpassant)))
+
+
+def to_fen(game_state):
+    # works for any board representation, and for a Position
+    return "%s %d %d" % (epd_fields(game_state), getattr(game_state, "halfmove_clock", 0),
+                         getattr(game_state, "fullmove_number", 1))
+
+
+def to_epd(game_state, operations=None):
+    # operations as parse_epd returns them, operands are written out unchanged
+    text = epd_fields(game_state)
+    for opcode, operand in (operations or {}).items():
+        text += " %s %s;" % (opcode, operand) if operand else " %s;" % opcode
+    return text
+
+
+def fullmove_number(start_number, start_white_move, move_log):
+    return start_number + (len(move_log) + (0 if start_white_move else 1)) // 2
@@ -0,0 +1,361 @@
+"""
+Headless game server hosting many games at once.
+Clients connect over a local TCP socket and exchange one JSON object per line in each direction.
+Bot moves are searched on a bounded process pool. Games waiting for a search are served first come
+first served and a game never has more than one search queued or running, so a busy game cannot
+crowd out the others. Every game has a thinking time budget for its bot, each search gets a share of
+what is left.
+
+python game_server.py --port 8765 --workers 4 --report-interval 60
+
+{"cmd": "new", "bot": "black", "time_budget": 300}   -> {"ok": true, "game": 1, "fen": "...", "status": "playing", ...}
+{"cmd": "move", "game": 1, "move": "e2e4"}          -> {"ok": true, ...}
+                                                       and later {"event": "bot_move", "game": 1, "move": "e7e5", ...}
+{"cmd": "state", "game": 1}
+{"cmd": "stats"}                                     -> queue depth, searches running, move latency overall and per game
+{"cmd": "close", "game": 1}
+"""
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import multiprocessing
+import random
+import sys
+import time
+import ChessBot
+import engine
+import evaluation
+import fen
+from transposition import TranspositionTable
+
+HOST = "127.0.0.1"
+PORT = 8765
+# searches running at the same time, one process each
+WORKERS = multiprocessing.cpu_count()
+# seconds of thinking a new game's bot gets for the whole game, and the most one move may take
+TIME_BUDGET = 300.0
+MOVE_TIME = 2.0
+# a game's budget is shared out as if this many moves were still to come
+MOVES_TO_GO = 30
+MIN_MOVE_TIME = 0.05
+# transposition table of each game's search context, and how many game contexts a pool worker keeps
+GAME_HASH_MB = 4
+CONTEXTS_PER_WORKER = 16
+# move latencies kept per game for the statistics
+LATENCY_HISTORY = 100
+
+# game id to SearchContext, least recently searched first, in every pool worker
+worker_contexts = collections.OrderedDict()
+
+
+def search_game(game_id, start_fen, moves, backend, time_limit):
+    """
+    Runs in a pool worker: rebuilds the position from the start and the packed moves played since,
+    and searches it with the game's own context so the game's tables stay warm on this worker.
+    Returns the packed best move, or None, and a summary of the search.
+    """
+    game_state = engine.GameState.from_fen(start_fen)
+    for move in moves:
+        game_state.make_move(move)
+    context = worker_contexts.pop(game_id, None)
+    if context is None:
+        context = ChessBot.SearchContext(TranspositionTable(GAME_HASH_MB))
+    worker_contexts[game_id] = context
+    if len(worker_contexts) > CONTEXTS_PER_WORKER:
+        worker_contexts.popitem(last=False)
+    reports = ChessBot.QueueList()
+    ChessBot.find_best_move(game_state, game_state.get_valid_moves(), reports, backend=backend,
+                            time_limit=time_limit, workers=1, context=context)
+    best_move = reports[-1]
+    # a book move comes without a report
+    last = reports[-2] if len(reports) > 1 else {"depth": 0, "score": 0, "nodes": 0}
+    return (best_move.packed if best_move is not None else None,
+            {"depth": last["depth"], "score": evaluation.to_pawns(last["score"]), "nodes": last["nodes"]})
+
+
+def check_position(game_state):
+    # raises ValueError for a position no search can start from
+    # castling rights and en passant squares the board does not back are already dropped by fen.parse_fields
+    for king, side in (("wK", "white"), ("bK", "black")):
+        count = sum(row.count(king) for row in game_state.board)
+        if count != 1:
+            raise ValueError("a position needs exactly one %s king, it has %d" % (side, count))
+    if any(piece[1] == "p" for piece in game_state.board[0] + game_state.board[7]):
+        raise ValueError("a position cannot have a pawn on the first or last rank")
+    # the side that just moved cannot have left its king in check
+    row, col = game_state.black_king_loc if game_state.white_move else game_state.white_king_loc
+    if game_state.attacked_by(row, col, "w" if game_state.white_move else "b"):
+        raise ValueError("the side not to move is in check")
+
+
+def latency_summary(latencies):
+    if not latencies:
+        return {"moves": 0}
+    ordered = sorted(latencies)
+    return {"moves": len(ordered), "mean": round(sum(ordered) / len(ordered), 4),
+            "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4), "max": round(ordered[-1], 4)}
+
+
+class ServerGame:
+    def __init__(self, game_id, start_fen, bot_white, bot_black, time_budget, move_time, writer):
+        self.game_id = game_id
+        self.start_fen = start_fen
+        self.game_state = engine.GameState.from_fen(start_fen)
+        check_position(self.game_state)
+        self.valid_moves = self.game_state.get_valid_moves()
+        self.bot_white = bot_white
+        self.bot_black = bot_black
+        self.time_left = time_budget
+        self.move_time = move_time
+        # the connection events of this game are sent to
+        self.writer = writer
+        self.searching = False
+        self.closed = False
+        self.request_time = None
+        self.latencies = collections.deque(maxlen=LATENCY_HISTORY)
+
+    def bot_to_move(self):
+        return self.bot_white if self.game_state.white_move else self.bot_black
+
+    def status(self):
+        if self.game_state.checkmate:
+            return "checkmate"
+        if self.game_state.stalemate:
+            return "stalemate"
+        # "threefold repetition" or "fifty-move rule"
+        return self.game_state.draw_reason() or "playing"
+
+    def time_limit(self):
+        return max(MIN_MOVE_TIME, min(self.move_time, self.time_left / MOVES_TO_GO))
+
+    def play(self, move):
+        self.game_state.make_move(move)
+        self.valid_moves = self.game_state.get_valid_moves()
+
+    def find_move(self, notation):
+        # promotions are always to a queen, so the promotion letter is not compared
+        for move in self.valid_moves:
+            if move.get_uci_notation()[:4] == notation[:4]:
+                return move
+        return None
+
+    def describe(self):
+        return {"game": self.game_id, "fen": self.game_state.to_fen(), "status": self.status(),
+                "to_move": "white" if self.game_state.white_move else "black",
+                "moves": len(self.game_state.move_log), "time_left": round(self.time_left, 3),
+                "searching": self.searching}
+
+
+class GameServer:
+    def __init__(self, workers=WORKERS, backend=ChessBot.BACKEND):
+        self.workers = workers
+        self.backend = backend
+        self.games = {}
+        self.next_game_id = 1
+        self.executor = None
+        self.queue = None
+        self.server = None
+        self.tasks = []
+        # writer to handler task of every open connection
+        self.clients = {}
+        self.running = 0
+        self.max_queue_depth = 0
+        self.searches = 0
+        self.search_seconds = 0.0
+        self.latencies = collections.deque(maxlen=LATENCY_HISTORY * 10)
+
+    async def start(self, host=HOST, port=PORT):
+        self.executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+        self.queue = asyncio.Queue()
+        # one consumer per pool process, so at most that many searches are handed to the pool
+        self.tasks = [asyncio.create_task(self.search_loop()) for _ in range(self.workers)]
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+        # closed connections read an end of file, so their handlers finish instead of being cancelled
+        clients = list(self.clients.items())
+        for writer, _ in clients:
+            writer.close()
+        await asyncio.gather(*(task for _, task in clients), return_exceptions=True)
+        if self.server is not None:
+            await self.server.wait_closed()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def handle_client(self, reader, writer):
+        self.clients[writer] = asyncio.current_task()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    reply = self.handle(json.loads(line), writer)
+                except (ValueError, KeyError, TypeError, AttributeError) as error:
+                    reply = {"ok": False, "error": str(error)}
+                send(writer, reply)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        except asyncio.CancelledError:
+            writer.close()
+            raise
+        finally:
+            self.clients.pop(writer, None)
+            # a connection's games end with it
+            for game in list(self.games.values()):
+                if game.writer is writer:
+                    self.close_game(game)
+            writer.close()
+
+    def handle(self, message, writer):
+        command = message["cmd"]
+        if command == "new":
+            return self.new_game(message, writer)
+        if command == "stats":
+            return dict(self.stats(), ok=True)
+        if command not in ("move", "state", "close"):
+            raise ValueError("unknown command: %s" % command)
+        game = self.games.get(message.get("game"))
+        if game is None:
+            raise ValueError("no such game: %s" % message.get("game"))
+        if command == "move":
+            return self.human_move(game, message["move"])
+        if command == "state":
+            return dict(game.describe(), ok=True)
+        self.close_game(game)
+        return {"ok": True, "game": game.game_id}
+
+    def new_game(self, message, writer):
+        bot = message.get("bot", "black")
+        if bot not in ("white", "black", "both", "none"):
+            raise ValueError("bot is white, black, both or none: %s" % bot)
+        game = ServerGame(self.next_game_id, message.get("fen", fen.START_FEN), bot in ("white", "both"), bot in ("black", "both"),
+                          float(message.get("time_budget", TIME_BUDGET)), float(message.get("move_time", MOVE_TIME)),
+                          writer)
+        self.next_game_id += 1
+        self.games[game.game_id] = game
+        self.request_search(game)
+        return dict(game.describe(), ok=True)
+
+    def human_move(self, game, notation):
+        if game.status() != "playing":
+            raise ValueError("game %d is over" % game.game_id)
+        if game.bot_to_move():
+            raise ValueError("the bot is to move in game %d" % game.game_id)
+        move = game.find_move(notation)
+        if move is None:
+            raise ValueError("illegal move: %s" % notation)
+        game.play(move)
+        self.request_search(game)
+        return dict(game.describe(), ok=True)
+
+    def close_game(self, game):
+        game.closed = True
+        self.games.pop(game.game_id, None)
+
+    def request_search(self, game):
+        if game.closed or game.searching or not game.bot_to_move() or game.status() != "playing":
+            return
+        game.searching = True
+        game.request_time = time.perf_counter()
+        self.queue.put_nowait(game)
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+
+    async def search_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            game = await self.queue.get()
+            if not game.closed:
+                self.running += 1
+                try:
+                    await self.run_search(game, loop)
+                finally:
+                    self.running -= 1
+
+    async def run_search(self, game, loop):
+        started = time.perf_counter()
+        try:
+            packed, report = await loop.run_in_executor(
+                self.executor, search_game, game.game_id, game.start_fen, list(game.game_state.move_log),
+                self.backend, game.time_limit())
+        except Exception as error:
+            # a failed search must neither end this consumer nor leave the game waiting for ever,
+            # the bot plays a random legal move instead
+            send(game.writer, {"event": "error", "game": game.game_id, "error": str(error)})
+            packed, report = None, {"depth": 0, "score": 0, "nodes": 0}
+        finished = time.perf_counter()
+        self.searches += 1
+        self.search_seconds += finished - started
+        game.time_left = max(0.0, game.time_left - (finished - started))
+        game.searching = False
+        if game.closed:
+            return
+        move = next((move for move in game.valid_moves if move.packed == packed), None)
+        if move is None:
+            move = random.choice(game.valid_moves)
+        game.play(move)
+        latency = finished - game.request_time
+        game.latencies.append(latency)
+        self.latencies.append(latency)
+        send(game.writer, dict(game.describe(), event="bot_move", move=move.get_uci_notation(),
+                               latency=round(latency, 4), queue_wait=round(started - game.request_time, 4), **report))
+        # a game with bots on both sides goes straight back in the queue, behind the games already waiting
+        self.request_search(game)
+
+    def stats(self):
+        return {"games": len(self.games), "workers": self.workers, "queue_depth": self.queue.qsize(),
+                "max_queue_depth": self.max_queue_depth, "searching": self.running, "searches": self.searches,
+                "search_seconds": round(self.search_seconds, 3), "latency": latency_summary(self.latencies),
+                "per_game": {game.game_id: latency_summary(game.latencies) for game in self.games.values()}}
+
+
+def send(writer, message):
+    if not writer.is_closing():
+        writer.write((json.dumps(message) + "\n").encode())
+
+
+async def report_stats(server, interval):
+    while True:
+        await asyncio.sleep(interval)
+        sys.stderr.write(json.dumps(server.stats()) + "\n")
+
+
+async def serve(host, port, workers, backend, report_interval):
+    game_server = GameServer(workers, backend)
+    server = await game_server.start(host, port)
+    sys.stderr.write("serving on %s:%d with %d workers\n" % (host, port, workers))
+    if report_interval:
+        asyncio.create_task(report_stats(game_server, report_interval))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await game_server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host many games and search their bot moves on a process pool")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--backend", choices=sorted(ChessBot.BACKENDS) + ["string"], default=ChessBot.BACKEND)
+    parser.add_argument("--report-interval", type=float, default=0, help="seconds between stats lines on stderr")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.backend, args.report_interval))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,359 @@
+"""
+Compact board backend for the engine.
+The position lives in a 10x12 mailbox of integer piece codes,
+the 8x8 list of strings is only built as a view when drawing or FEN asks for it.
+"""
+from ChessLib import Move, piece_numbers, NO_PIECE, ENPASSANT, CASTLE, PROMOTION
+import zobrist
+from position_history import PositionHistory
+
+EMPTY = 0
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = 1, 2, 3, 4, 5, 6
+WHITE = 8
+BLACK = 16
+OFFBOARD = WHITE | BLACK
+COLOR_MASK = WHITE | BLACK
+TYPE_MASK = 7
+
+piece_codes = {"**": EMPTY}
+for color_name, color in (("w", WHITE), ("b", BLACK)):
+    for type_name, piece_type in (("p", PAWN), ("N", KNIGHT), ("B", BISHOP),
+                                  ("R", ROOK), ("Q", QUEEN), ("K", KING)):
+        piece_codes[color_name + type_name] = color | piece_type
+code_pieces = {code: piece for piece, code in piece_codes.items()}
+# piece codes to packed move piece numbers and back
+code_numbers = [NO_PIECE] * 32
+for piece, code in piece_codes.items():
+    code_numbers[code] = piece_numbers[piece]
+number_codes = [EMPTY] * 16
+for piece, code in piece_codes.items():
+    number_codes[piece_numbers[piece]] = code
+
+# 10x12 layout, row 0 is the eighth rank like the string board
+board_squares = [21 + row * 10 + col for row in range(8) for col in range(8)]
+sq_row = [-1] * 120
+sq_col = [-1] * 120
+# the row * 8 + col square of packed moves
+sq64 = [-1] * 120
+for sq in board_squares:
+    sq_row[sq] = (sq - 21) // 10
+    sq_col[sq] = (sq - 21) % 10
+    sq64[sq] = sq_row[sq] * 8 + sq_col[sq]
+
+
+def to_square(row, col):
+    return 21 + row * 10 + col
+
+
+rook_directions = (-10, -1, 10, 1)
+bishop_directions = (-11, -9, 9, 11)
+queen_directions = rook_directions + bishop_directions
+knight_offsets = (-21, -19, -12, -8, 8, 12, 19, 21)
+king_offsets = queen_directions
+
+
+class MailboxGameState(PositionHistory):
+    def __init__(self, position=None):
+        # position is a fen.Position or another game state to start from, None is the initial position
+        position = self.initial_position(position)
+        self.squares = bytearray([OFFBOARD] * 120)
+        self.set_board(position.board)
+        self.start_position(position, position.board)
+
+    def set_board(self, board):
+        for row in range(8):
+            for col in range(8):
+                piece = board[row][col]
+                self.squares[to_square(row, col)] = piece_codes[piece]
+                if piece == "wK":
+                    self.white_king_sq = to_square(row, col)
+                elif piece == "bK":
+                    self.black_king_sq = to_square(row, col)
+
+    @property
+    def board(self):
+        # the 8x8 list of strings for drawing and FEN, built when asked for so make_move never writes it
+        squares = self.squares
+        return [[code_pieces[squares[21 + row * 10 + col]] for col in range(8)] for row in range(8)]
+
+    @property
+    def white_king_loc(self):
+        return sq_row[self.white_king_sq], sq_col[self.white_king_sq]
+
+    @property
+    def black_king_loc(self):
+        return sq_row[self.black_king_sq], sq_col[self.black_king_sq]
+
+    def put(self, sq, code):
+        self.squares[sq] = code
+
+    def enpassant_key(self):
+        # zobrist.enpassant_key from the mailbox, hashed only when a pawn of the side to move can take
+        if self.can_enpassant == ():
+            return 0
+        row, col = self.can_enpassant
+        if self.white_move:
+            pawn_sq, pawn = to_square(row + 1, col), WHITE | PAWN
+        else:
+            pawn_sq, pawn = to_square(row - 1, col), BLACK | PAWN
+        squares = self.squares
+        if squares[pawn_sq - 1] == pawn or squares[pawn_sq + 1] == pawn:
+            return zobrist.enpassant_keys[col]
+        return 0
+
+    def make_move(self, move):
+        # move is packed, a Move from get_valid_moves is packed first
+        if not isinstance(move, int):
+            move = move.packed
+        enpassant_before = self.enpassant_key()
+        start = board_squares[move & 63]
+        end = board_squares[move >> 6 & 63]
+        code = self.squares[start]
+        self.put(start, EMPTY)
+        if move & PROMOTION:
+            self.put(end, (code & COLOR_MASK) | QUEEN)
+        else:
+            self.put(end, code)
+
+        if code == WHITE | KING:
+            self.white_king_sq = end
+        elif code == BLACK | KING:
+            self.black_king_sq = end
+
+        if move & ENPASSANT:
+            self.put(start - sq_col[start] + sq_col[end], EMPTY)
+
+        if move & CASTLE:
+            if end - start == 2:
+                self.put(end - 1, self.squares[end + 1])
+                self.put(end + 1, EMPTY)
+            else:
+                self.put(end + 1, self.squares[end - 2])
+                self.put(end - 2, EMPTY)
+
+        self.push_move_state(move, enpassant_before)
+
+    def undo_move(self):
+        if len(self.move_log) != 0:
+            move = self.pop_move_state()
+            start = board_squares[move & 63]
+            end = board_squares[move >> 6 & 63]
+            code = number_codes[move >> 12 & 15]
+            captured = number_codes[move >> 16 & 15]
+            self.put(start, code)
+            self.put(end, captured)
+            if code == WHITE | KING:
+                self.white_king_sq = start
+            elif code == BLACK | KING:
+                self.black_king_sq = start
+            if move & ENPASSANT:
+                self.put(end, EMPTY)
+                self.put(start - sq_col[start] + sq_col[end], captured)
+
+            if move & CASTLE:
+                if end - start == 2:
+                    self.put(end + 1, self.squares[end - 1])
+                    self.put(end - 1, EMPTY)
+                else:
+                    self.put(end - 2, self.squares[end + 1])
+                    self.put(end + 1, EMPTY)
+
+    def has_non_pawn_material(self):
+        # a knight, bishop, rook or queen of the side to move, passing is only safe with one
+        us = WHITE if self.white_move else BLACK
+        squares = self.squares
+        for sq in board_squares:
+            code = squares[sq]
+            if code & COLOR_MASK == us and code & TYPE_MASK not in (PAWN, KING):
+                return True
+        return False
+
+    def is_attacked(self, sq, by_color):
+        squares = self.squares
+        for offset in knight_offsets:
+            if squares[sq + offset] == by_color | KNIGHT:
+                return True
+        for offset in king_offsets:
+            if squares[sq + offset] == by_color | KING:
+                return True
+        if by_color == WHITE:
+            if squares[sq + 9] == WHITE | PAWN or squares[sq + 11] == WHITE | PAWN:
+                return True
+        elif squares[sq - 9] == BLACK | PAWN or squares[sq - 11] == BLACK | PAWN:
+            return True
+        rook, bishop, queen = by_color | ROOK, by_color | BISHOP, by_color | QUEEN
+        for direction in rook_directions:
+            target = sq + direction
+            while squares[target] == EMPTY:
+                target += direction
+            if squares[target] == rook or squares[target] == queen:
+                return True
+        for direction in bishop_directions:
+            target = sq + direction
+            while squares[target] == EMPTY:
+                target += direction
+            if squares[target] == bishop or squares[target] == queen:
+                return True
+        return False
+
+    def square_under_attack(self, row, col):
+        return self.is_attacked(to_square(row, col), BLACK if self.white_move else WHITE)
+
+    def in_check(self):
+        if self.white_move:
+            return self.is_attacked(self.white_king_sq, BLACK)
+        return self.is_attacked(self.black_king_sq, WHITE)
+
+    def get_pseudo_moves(self, us, captures_only=False):
+        # packed moves, castling is generated separately
+        # captures_only keeps captures, en passant and pushes to the last rank
+        squares = self.squares
+        them = OFFBOARD ^ us
+        moves = []
+        for start in board_squares:
+            code = squares[start]
+            if code & COLOR_MASK != us:
+                continue
+            piece_type = code & TYPE_MASK
+            from_bits = sq64[start] | code_numbers[code] << 12
+            if piece_type == PAWN:
+                forward = -10 if us == WHITE else 10
+                end = start + forward
+                promotion = PROMOTION if sq_row[end] == 0 or sq_row[end] == 7 else 0
+                if squares[end] == EMPTY:
+                    if not captures_only or promotion:
+                        moves.append(from_bits | sq64[end] << 6 | NO_PIECE << 16 | promotion)
+                    start_row = 6 if us == WHITE else 1
+                    if not captures_only and sq_row[start] == start_row and squares[end + forward] == EMPTY:
+                        moves.append(from_bits | sq64[end + forward] << 6 | NO_PIECE << 16)
+                for end in (start + forward - 1, start + forward + 1):
+                    if squares[end] & COLOR_MASK == them:
+                        moves.append(from_bits | sq64[end] << 6 | code_numbers[squares[end]] << 16 | promotion)
+                    elif squares[end] == EMPTY and self.can_enpassant == (sq_row[end], sq_col[end]):
+                        moves.append(from_bits | sq64[end] << 6 | code_numbers[them | PAWN] << 16 | ENPASSANT)
+            elif piece_type == KNIGHT or piece_type == KING:
+                for offset in (knight_offsets if piece_type == KNIGHT else king_offsets):
+                    end = start + offset
+                    if (squares[end] == EMPTY and not captures_only) or squares[end] & COLOR_MASK == them:
+                        moves.append(from_bits | sq64[end] << 6 | code_numbers[squares[end]] << 16)
+            else:
+                if piece_type == ROOK:
+                    directions = rook_directions
+                elif piece_type == BISHOP:
+                    directions = bishop_directions
+                else:
+                    directions = queen_directions
+                for direction in directions:
+                    end = start + direction
+                    while squares[end] == EMPTY:
+                        if not captures_only:
+                            moves.append(from_bits | sq64[end] << 6 | NO_PIECE << 16)
+                        end += direction
+                    if squares[end] & COLOR_MASK == them:
+                        moves.append(from_bits | sq64[end] << 6 | code_numbers[squares[end]] << 16)
+        return moves
+
+    def is_legal(self, move, us):
+        # play the packed move on the mailbox only and look for attacks on our king
+        squares = self.squares
+        start = board_squares[move & 63]
+        end = board_squares[move >> 6 & 63]
+        code = squares[start]
+        captured = squares[end]
+        squares[end] = code
+        squares[start] = EMPTY
+        enpassant_sq = start - sq_col[start] + sq_col[end]
+        if move & ENPASSANT:
+            squares[enpassant_sq] = EMPTY
+        if code & TYPE_MASK == KING:
+            king_sq = end
+        else:
+            king_sq = self.white_king_sq if us == WHITE else self.black_king_sq
+        legal = not self.is_attacked(king_sq, OFFBOARD ^ us)
+        squares[start] = code
+        squares[end] = captured
+        if move & ENPASSANT:
+            squares[enpassant_sq] = (OFFBOARD ^ us) | PAWN
+        return legal
+
+    def get_pinned(self, king_sq, us):
+        # squares of our pieces that shield the king from an enemy slider
+        squares = self.squares
+        them = OFFBOARD ^ us
+        pinned = set()
+        for direction in queen_directions:
+            slider = ROOK if direction in rook_directions else BISHOP
+            target = king_sq + direction
+            while squares[target] == EMPTY:
+                target += direction
+            if squares[target] & COLOR_MASK != us:
+                continue
+            candidate = target
+            target += direction
+            while squares[target] == EMPTY:
+                target += direction
+            if squares[target] == them | slider or squares[target] == them | QUEEN:
+                pinned.add(candidate)
+        return pinned
+
+    def get_valid_moves(self):
+        # Move objects for display and notation, the search uses get_packed_moves
+        return [Move.from_packed(move) for move in self.get_packed_moves()]
+
+    def get_packed_moves(self):
+        us = WHITE if self.white_move else BLACK
+        king_sq = self.white_king_sq if us == WHITE else self.black_king_sq
+        self.is_in_check = self.is_attacked(king_sq, OFFBOARD ^ us)
+        pinned = self.get_pinned(king_sq, us)
+        moves = []
+        for move in self.get_pseudo_moves(us):
+            # only king moves, pinned pieces, en passant and check evasions need the full test
+            start = board_squares[move & 63]
+            if self.is_in_check or move & ENPASSANT or start == king_sq or start in pinned:
+                if not self.is_legal(move, us):
+                    continue
+            moves.append(move)
+        if not self.is_in_check:
+            self.get_castle_moves(king_sq, us, moves)
+
+        if len(moves) == 0:
+            if self.is_in_check:
+                self.checkmate = True
+            else:
+                self.stalemate = True
+        else:
+            self.checkmate = False
+            self.stalemate = False
+        return moves
+
+    def get_capture_moves(self):
+        # packed legal captures and queen promotions for the quiescence search, every evasion when in check
+        us = WHITE if self.white_move else BLACK
+        king_sq = self.white_king_sq if us == WHITE else self.black_king_sq
+        self.is_in_check = self.is_attacked(king_sq, OFFBOARD ^ us)
+        if self.is_in_check:
+            return self.get_packed_moves()
+        pinned = self.get_pinned(king_sq, us)
+        moves = []
+        for move in self.get_pseudo_moves(us, captures_only=True):
+            start = board_squares[move & 63]
+            if move & ENPASSANT or start == king_sq or start in pinned:
+                if not self.is_legal(move, us):
+                    continue
+            moves.append(move)
+        return moves
+
+    def get_castle_moves(self, king_sq, us, moves):
+        squares = self.squares
+        them = OFFBOARD ^ us
+        rights = self.curr_castling_rights
+        king_side = rights.wk if us == WHITE else rights.bk
+        queen_side = rights.wq if us == WHITE else rights.bq
+        king_bits = sq64[king_sq] | code_numbers[us | KING] << 12 | NO_PIECE << 16 | CASTLE
+        if king_side and squares[king_sq + 1] == EMPTY and squares[king_sq + 2] == EMPTY:
+            if not self.is_attacked(king_sq + 1, them) and not self.is_attacked(king_sq + 2, them):
+                moves.append(king_bits | sq64[king_sq + 2] << 6)
+        if queen_side and squares[king_sq - 1] == EMPTY and squares[king_sq - 2] == EMPTY \
+                and squares[king_sq - 3] == EMPTY:
+            if not self.is_attacked(king_sq - 1, them) and not self.is_attacked(king_sq - 2, them):
+                moves.append(king_bits | sq64[king_sq - 2] << 6)
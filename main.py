@@ -3,9 +3,11 @@ Main driver
 user input.
 """
 import sys
-from multiprocessing import Process, Queue
 import pygame as p
 import engine, ChessBot
+from ChessLib import Move
+from engine_service import EngineService
+from move_cache import MoveCache
 
 IMAGES = {}
 FPS = 30
@@ -15,6 +17,8 @@ MOVE_PANEL_WIDTH = 264
 MOVE_PANEL_HEIGHT = PY_BOARD_HEIGHT
 DIMENSIONS = 8
 SQ_SIZE = PY_BOARD_HEIGHT // DIMENSIONS
+# legal move lists kept for positions already seen, so undoing and replaying moves does not regenerate them
+MOVE_CACHE_SIZE = 1024
 
 
 def main():
@@ -28,13 +32,16 @@ def main():
     screen = p.display.set_mode((PY_BOARD_WIDTH + MOVE_PANEL_WIDTH, PY_BOARD_HEIGHT))
     screen.fill(p.Color("white"))
     clock = p.time.Clock()
-    game_state = engine.GameState()
+    move_cache = MoveCache(MOVE_CACHE_SIZE)
+    game_state = engine.GameState(move_cache=move_cache)
     valid_moves = game_state.get_valid_moves()
     sq_selected = ()  
     sq_clicks = [] 
     load_img()  
     log_font = p.font.SysFont("Arial", 14, False, False)
-    ai_process = None
+    # one engine process for the whole session, it keeps its tables between moves
+    service = EngineService()
+    search_id = None
     move_made = False  
     move_undo = False
     animate = False  
@@ -43,6 +50,7 @@ def main():
         human_move = (game_state.white_move and player1) or (not game_state.white_move and player2)
         for e in p.event.get():
             if e.type == p.QUIT:
+                service.close()
                 p.quit()
                 sys.exit()
             elif e.type == p.MOUSEBUTTONDOWN:
@@ -77,42 +85,44 @@ def main():
                     animate = False
                     game_ended = False
                     if bot_thinking:
-                        ai_process.terminate()
+                        service.stop()
                         bot_thinking = False
                     move_undo = True
                     # resets game on R
                 if e.key == p.K_r:  
-                    game_state = engine.GameState()
+                    game_state = engine.GameState(move_cache=move_cache)
                     valid_moves = game_state.get_valid_moves()
                     sq_selected = ()
                     sq_clicks = []
                     move_made = False
                     animate = False
                     game_ended = False
-                    if bot_thinking:
-                        ai_process.terminate()
-                        bot_thinking = False
+                    service.new_game()
+                    bot_thinking = False
                     move_undo = True
 
         if not game_ended and not human_move and not move_undo:
             if not bot_thinking:
                 bot_thinking = True
-                return_queue = Queue()  
-                ai_process = Process(target=ChessBot.find_best_move, args=(game_state, valid_moves, return_queue))
-                ai_process.start()
-
-            if not ai_process.is_alive():
-                ai_move = return_queue.get()
+                service.set_position(game_state.move_log)
+                search_id = service.go()
+
+            # per-depth search reports come first, the chosen move last
+            result = service.poll()
+            while result is not None and (result[0] != search_id or isinstance(result[1], dict)):
+                result = service.poll()
+            if result is not None:
+                ai_move = result[1]
                 if ai_move is None:
                     ai_move = ChessBot.find_random_move(valid_moves)
-                game_state.make_move(ai_move)
+                game_state.make_move(valid_moves[valid_moves.index(ai_move)])
                 move_made = True
                 animate = True
                 bot_thinking = False
 
         if move_made:
             if animate:
-                animate_move(game_state.move_log[-1], screen, game_state.board, clock)
+                animate_move(Move.from_packed(game_state.move_log[-1]), screen, game_state.board, clock)
             valid_moves = game_state.get_valid_moves()
             move_made = False
             animate = False
@@ -134,6 +144,10 @@ def main():
             game_ended = True
             draw_end_text(screen, "Stalemate")
 
+        elif game_state.draw_reason() is not None:
+            game_ended = True
+            draw_end_text(screen, "Draw by " + game_state.draw_reason())
+
         clock.tick(FPS)
         p.display.flip()
 
@@ -168,7 +182,7 @@ def draw_game_state(screen, game_state, valid_moves, sq_selected):
 
 def highlight_squares(screen, game_state, valid_moves, sq_selected):
     if (len(game_state.move_log)) > 0:
-        last_move = game_state.move_log[-1]
+        last_move = Move.from_packed(game_state.move_log[-1])
         s = p.Surface((SQ_SIZE, SQ_SIZE))
         s.set_alpha(100)
         s.fill(p.Color('green'))
@@ -223,7 +237,8 @@ def draw_end_text(screen, text):
 def draw_move_log(screen, game_state, font):
     move_log_rect = p.Rect(PY_BOARD_WIDTH, 0, MOVE_PANEL_WIDTH, MOVE_PANEL_HEIGHT)
     p.draw.rect(screen, p.Color('black'), move_log_rect)
-    move_log = game_state.move_log
+    # the log holds packed moves, Move objects are made here for their notation
+    move_log = [Move.from_packed(move) for move in game_state.move_log]
     move_texts = []
     for i in range(0, len(move_log), 2):
         move_string = str(i // 2 + 1) + '. ' + str(move_log[i]) + " "
@@ -0,0 +1,48 @@
+"""
+Bounded cache of legal move lists for a game state.
+Entries are keyed by the Zobrist key of the position, which covers the board, the side to move,
+castling rights and a capturable en passant square, so an entry stays right however the
+position was reached and nothing has to be invalidated when moves are made or undone.
+The least recently used entry is dropped when the cache is full.
+"""
+from collections import OrderedDict
+
+
+class MoveCache:
+    def __init__(self, size=4096):
+        self.size = size
+        self.entries = OrderedDict()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.entries.clear()
+        self.reset_stats()
+
+    def get(self, key):
+        # (moves, checkmate, stalemate, in_check) for key, or None, moves is a tuple of packed moves
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, moves, checkmate, stalemate, in_check):
+        entries = self.entries
+        entries[key] = (tuple(moves), checkmate, stalemate, in_check)
+        entries.move_to_end(key)
+        if len(entries) > self.size:
+            entries.popitem(last=False)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {"entries": len(self.entries), "size": self.size, "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hit_rate(), 4)}
@@ -0,0 +1,98 @@
+"""
+Move ordering for the alpha-beta search.
+Moves are scored once per node (hash move, captures by MVV-LVA, promotions,
+killer moves, then the history table) and handed out best first by selection,
+so a node that cuts off early never orders the rest of its moves.
+"""
+from ChessLib import piece_number_values, NO_PIECE, PROMOTION, SQUARES_MASK
+from transposition import NO_MOVE
+
+HASH_MOVE_SCORE = 1000000
+CAPTURE_SCORE = 100000
+PROMOTION_SCORE = 90000
+KILLER_SCORE = 80000
+# history scores are halved once one of them gets here, so they stay below the killers
+HISTORY_LIMIT = 50000
+MAX_PLY = 128
+
+
+def history_index(move, white_move):
+    # the start and end squares of the packed move, one table per side
+    return (0 if white_move else 4096) + (move & SQUARES_MASK)
+
+
+class MoveOrderer:
+    def __init__(self):
+        self.killers = [[NO_MOVE, NO_MOVE] for _ in range(MAX_PLY)]
+        self.history = [0] * (2 * 64 * 64)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def new_search(self):
+        # killers belong to the old position, history is only aged
+        self.killers = [[NO_MOVE, NO_MOVE] for _ in range(MAX_PLY)]
+        self.history = [value // 2 for value in self.history]
+        self.reset_stats()
+
+    def score_moves(self, moves, hash_move, ply, white_move):
+        killers = self.killers[ply] if ply < MAX_PLY else (NO_MOVE, NO_MOVE)
+        history = self.history
+        scores = []
+        side = 0 if white_move else 4096
+        for move in moves:
+            captured = move >> 16 & 15
+            if move == hash_move:
+                scores.append(HASH_MOVE_SCORE)
+            elif captured != NO_PIECE:
+                scores.append(CAPTURE_SCORE + 10 * piece_number_values[captured] -
+                              piece_number_values[move >> 12 & 15])
+            elif move & PROMOTION:
+                scores.append(PROMOTION_SCORE)
+            elif move == killers[0]:
+                scores.append(KILLER_SCORE)
+            elif move == killers[1]:
+                scores.append(KILLER_SCORE - 1)
+            else:
+                scores.append(history[side + (move & SQUARES_MASK)])
+        return scores
+
+    def ordered(self, moves, scores):
+        # selection sort done one pick at a time, moves and scores are reordered in place
+        count = len(moves)
+        for i in range(count):
+            best = i
+            best_score = scores[i]
+            for j in range(i + 1, count):
+                if scores[j] > best_score:
+                    best = j
+                    best_score = scores[j]
+            if best != i:
+                moves[i], moves[best] = moves[best], moves[i]
+                scores[i], scores[best] = scores[best], scores[i]
+            yield moves[i]
+
+    def record_cutoff(self, move, move_number, depth, ply, white_move):
+        self.cutoffs += 1
+        if move_number == 0:
+            self.first_move_cutoffs += 1
+        if move >> 16 & 15 != NO_PIECE or move & PROMOTION:
+            return
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+        index = history_index(move, white_move)
+        self.history[index] += depth * depth
+        if self.history[index] > HISTORY_LIMIT:
+            self.history = [value // 2 for value in self.history]
+
+    def first_move_cutoff_rate(self):
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def stats(self):
+        return {"cutoffs": self.cutoffs, "first_move_cutoffs": self.first_move_cutoffs,
+                "first_move_cutoff_rate": self.first_move_cutoff_rate()}
@@ -0,0 +1,146 @@
+"""
+Minimal PGN reader.
+Games are read one at a time so a large collection never has to fit in memory.
+Comments, variations and NAGs are skipped, SAN moves are matched against the legal moves of the position.
+"""
+import re
+from engine import GameState
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+header_pattern = re.compile(r'\[(\w+)\s+"(.*)"\]')
+move_number_pattern = re.compile(r"^\d+\.+")
+san_pattern = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$")
+
+
+class PgnGame:
+    def __init__(self, headers, moves, result):
+        self.headers = headers
+        self.moves = moves
+        self.result = result
+
+    def start_state(self):
+        # games with a SetUp/FEN header start from that position
+        if "FEN" in self.headers:
+            return GameState.from_fen(self.headers["FEN"])
+        return GameState()
+
+
+def read_games(path):
+    # yields a PgnGame for every game in the file
+    with open(path, encoding="utf-8", errors="replace") as pgn_file:
+        headers = {}
+        movetext = []
+        for line in pgn_file:
+            line = line.strip()
+            if line.startswith("["):
+                if movetext:
+                    # no blank line before the next game's headers
+                    yield parse_movetext(headers, " ".join(movetext))
+                    headers = {}
+                    movetext = []
+                match = header_pattern.match(line)
+                if match:
+                    headers[match.group(1)] = match.group(2)
+            elif line.startswith("%"):
+                continue
+            elif line:
+                if ";" in line and "{" not in line:
+                    # rest of line comment
+                    line = line[:line.index(";")]
+                movetext.append(line)
+            elif movetext:
+                yield parse_movetext(headers, " ".join(movetext))
+                headers = {}
+                movetext = []
+        if movetext or headers:
+            yield parse_movetext(headers, " ".join(movetext))
+
+
+def parse_movetext(headers, text):
+    moves = []
+    result = headers.get("Result", "*")
+    depth = 0
+    for token in tokenize(text):
+        if token in ("(", ")"):
+            depth += 1 if token == "(" else -1
+        elif depth > 0 or token.startswith("$"):
+            continue
+        elif token in RESULTS:
+            result = token
+        else:
+            token = move_number_pattern.sub("", token)
+            if token:
+                moves.append(token)
+    return PgnGame(headers, moves, result)
+
+
+def tokenize(text):
+    # splits movetext into moves, move numbers, parentheses and results, dropping comments
+    tokens = []
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == "{":
+            end = text.find("}", i)
+            i = len(text) if end == -1 else end + 1
+        elif char == ";":
+            # read_games already cut rest of line comments off, a stray one is skipped
+            i += 1
+        elif char in "()":
+            tokens.append(char)
+            i += 1
+        elif char.isspace():
+            i += 1
+        else:
+            start = i
+            while i < len(text) and not text[i].isspace() and text[i] not in "{}();":
+                i += 1
+            tokens.append(text[start:i])
+    return tokens
+
+
+def san_to_move(game_state, san, valid_moves=None):
+    """
+    Finds the legal move written as san, e.g. Nf3, exd5, O-O or e8=Q+.
+    Raises ValueError for a move that is not legal here, or for an underpromotion the engine cannot play.
+    """
+    if valid_moves is None:
+        valid_moves = game_state.get_valid_moves()
+    san = san.rstrip("+#!?")
+    if san in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        end_col = 6 if len(san) == 3 else 2
+        for move in valid_moves:
+            if move.is_castle_move and move.end_col == end_col:
+                return move
+        raise ValueError("illegal castling: " + san)
+    match = san_pattern.match(san)
+    if match is None:
+        raise ValueError("cannot read move: " + san)
+    piece, from_file, from_rank, to_square, promotion = match.groups()
+    piece = piece or "p"
+    if promotion is not None and promotion != "Q":
+        raise ValueError("underpromotion is not supported: " + san)
+    end_col = "abcdefgh".index(to_square[0])
+    end_row = 8 - int(to_square[1])
+    candidates = [move for move in valid_moves
+                  if move.piece_moved[1] == piece and move.end_row == end_row and move.end_col == end_col and
+                  (from_file is None or move.start_col == "abcdefgh".index(from_file)) and
+                  (from_rank is None or move.start_row == 8 - int(from_rank))]
+    if len(candidates) != 1:
+        raise ValueError(("ambiguous move: " if candidates else "illegal move: ") + san)
+    return candidates[0]
+
+
+def replay(game):
+    """
+    Plays through a game, yielding (game_state, move) before each move is made.
+    Stops early at a move that cannot be played, so a bad game still gives its first positions.
+    """
+    game_state = game.start_state()
+    for san in game.moves:
+        try:
+            move = san_to_move(game_state, san)
+        except ValueError:
+            return
+        yield game_state, move
+        game_state.make_move(move)
@@ -0,0 +1,189 @@
+"""
+Game state bookkeeping shared by every board representation.
+A board keeps one Zobrist key, halfmove clock, castling rights, en passant square and score per
+position it went through, which is all undo, repetition detection, the fifty-move rule and null moves need.
+The board only moves its own pieces in make_move and undo_move, provides a board property or attribute
+(the 8x8 list of strings) and an enpassant_key() method computed from its own representation.
+"""
+from ChessLib import CastleRights, chess_board, piece_numbers, NO_PIECE
+import zobrist
+import evaluation
+import fen
+
+WHITE_ROOK = piece_numbers["wR"]
+WHITE_KING = piece_numbers["wK"]
+BLACK_ROOK = piece_numbers["bR"]
+BLACK_KING = piece_numbers["bK"]
+
+
+class PositionHistory:
+    @classmethod
+    def from_game_state(cls, game_state):
+        return cls(game_state)
+
+    @classmethod
+    def from_fen(cls, text):
+        return cls(fen.parse_fen(text))
+
+    def to_fen(self):
+        return fen.to_fen(self)
+
+    @staticmethod
+    def initial_position(position):
+        # position is a fen.Position or another game state to start from, None is the initial position
+        if position is None:
+            return fen.Position(chess_board, True, CastleRights(True, True, True, True), ())
+        return position
+
+    def start_position(self, position, board):
+        # called from __init__ once the board is set up from position.board
+        self.checkmate = False
+        self.stalemate = False
+        self.is_in_check = False
+        self.white_move = position.white_move
+        self.can_enpassant = position.can_enpassant
+        self.enpassant_log = [self.can_enpassant]
+        self.move_log = []
+        rights = position.curr_castling_rights
+        self.curr_castling_rights = CastleRights(rights.wk, rights.bk, rights.wq, rights.bq)
+        self.castle_rights_log = [CastleRights(rights.wk, rights.bk, rights.wq, rights.bq)]
+        self.start_white_move = self.white_move
+        self.start_fullmove_number = getattr(position, "fullmove_number", 1)
+        # moves since the last capture or pawn move, one entry per position like the hash log
+        self.halfmove_log = [getattr(position, "halfmove_clock", 0)]
+        # a game state copied from another one starts with the keys of the positions it can still repeat
+        self.hash_log = list(getattr(position, "repetition_keys", ()))
+        self.hash_log.append(zobrist.board_key(board, self.white_move, self.curr_castling_rights,
+                                               self.can_enpassant))
+        self.score_log = [evaluation.board_score(board)]
+
+    @property
+    def fullmove_number(self):
+        return fen.fullmove_number(self.start_fullmove_number, self.start_white_move, self.move_log)
+
+    @property
+    def position_score(self):
+        # material and piece-square score, positive when white is better
+        return self.score_log[-1]
+
+    @property
+    def zobrist_key(self):
+        return self.hash_log[-1]
+
+    @property
+    def halfmove_clock(self):
+        return self.halfmove_log[-1]
+
+    @property
+    def repetition_keys(self):
+        # keys of the earlier positions since the last capture or pawn move, the only ones the current can repeat
+        return self.hash_log[max(0, len(self.hash_log) - 1 - self.halfmove_log[-1]):-1]
+
+    def is_repetition(self, count=1):
+        """
+        True when the current position occurred count times before.
+        Only the positions since the last capture or pawn move are looked at, and of those only
+        every other one, the ones with the same side to move.
+        """
+        hash_log = self.hash_log
+        key = hash_log[-1]
+        last = len(hash_log) - 1
+        seen = 0
+        for index in range(last - 4, max(-1, last - self.halfmove_log[-1] - 1), -2):
+            if hash_log[index] == key:
+                seen += 1
+                if seen == count:
+                    return True
+        return False
+
+    def push_move_state(self, move, enpassant_before):
+        # called by make_move once the pieces are moved, enpassant_before is enpassant_key() from before the move
+        castle_before = zobrist.castle_key(self.curr_castling_rights)
+        start = move & 63
+        end = move >> 6 & 63
+        self.move_log.append(move)
+        self.white_move = not self.white_move
+        if (move >> 12 & 15) % 6 == 0 and abs(start - end) == 16:
+            self.can_enpassant = ((start + end) >> 4, start & 7)
+        else:
+            self.can_enpassant = ()
+        self.enpassant_log.append(self.can_enpassant)
+        self.update_castle_rights(move)
+        rights = self.curr_castling_rights
+        self.castle_rights_log.append(CastleRights(rights.wk, rights.bk, rights.wq, rights.bq))
+        self.hash_log.append(zobrist.move_key(self.hash_log[-1], move, castle_before, enpassant_before,
+                                              zobrist.castle_key(rights), self.enpassant_key()))
+        self.score_log.append(self.score_log[-1] + evaluation.move_score(move))
+        if (move >> 12 & 15) % 6 == 0 or move >> 16 & 15 != NO_PIECE:
+            self.halfmove_log.append(0)
+        else:
+            self.halfmove_log.append(self.halfmove_log[-1] + 1)
+
+    def pop_move_state(self):
+        # called by undo_move before it puts the pieces back, returns the move taken back
+        move = self.move_log.pop()
+        self.white_move = not self.white_move
+        self.enpassant_log.pop()
+        self.can_enpassant = self.enpassant_log[-1]
+        self.castle_rights_log.pop()
+        # copy so the next make_move cannot edit the logged rights in place
+        rights = self.castle_rights_log[-1]
+        self.curr_castling_rights = CastleRights(rights.wk, rights.bk, rights.wq, rights.bq)
+        self.hash_log.pop()
+        self.halfmove_log.pop()
+        self.score_log.pop()
+        self.checkmate = False
+        self.stalemate = False
+        return move
+
+    def update_castle_rights(self, move):
+        # a rook leaving or taken on its corner, or the king moving, loses the right for good
+        rights = self.curr_castling_rights
+        start = move & 63
+        end = move >> 6 & 63
+        captured = move >> 16 & 15
+        if captured == WHITE_ROOK:
+            if end == 56:
+                rights.wq = False
+            elif end == 63:
+                rights.wk = False
+        elif captured == BLACK_ROOK:
+            if end == 0:
+                rights.bq = False
+            elif end == 7:
+                rights.bk = False
+
+        moved = move >> 12 & 15
+        if moved == WHITE_KING:
+            rights.wq = False
+            rights.wk = False
+        elif moved == BLACK_KING:
+            rights.bq = False
+            rights.bk = False
+        elif moved == WHITE_ROOK:
+            if start == 56:
+                rights.wq = False
+            elif start == 63:
+                rights.wk = False
+        elif moved == BLACK_ROOK:
+            if start == 0:
+                rights.bq = False
+            elif start == 7:
+                rights.bk = False
+
+    def make_null_move(self):
+        # passes the turn for null-move pruning, the move log is left alone and undo_null_move takes it back
+        enpassant_before = self.enpassant_key()
+        self.white_move = not self.white_move
+        self.can_enpassant = ()
+        self.enpassant_log.append(())
+        self.hash_log.append(self.hash_log[-1] ^ zobrist.turn_key ^ enpassant_before)
+        # no repetition reaches back past a null move
+        self.halfmove_log.append(0)
+
+    def undo_null_move(self):
+        self.white_move = not self.white_move
+        self.enpassant_log.pop()
+        self.can_enpassant = self.enpassant_log[-1]
+        self.hash_log.pop()
+        self.halfmove_log.pop()
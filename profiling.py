@@ -0,0 +1,146 @@
+"""
+Timing and profiling helpers for the search and the move generators.
+PhaseTimer adds up the calls and time of chosen methods of one object.
+profiled() runs a block under cProfile or a sampling profiler and writes the report to a directory.
+"""
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import types
+
+# seconds between two samples of the sampling profiler
+SAMPLE_INTERVAL = 0.001
+
+
+class PhaseTimer:
+    # wraps the named methods of one object and adds up their calls and time
+    # a method returning a generator is also timed while the generator runs
+    def __init__(self, target, names):
+        self.target = target
+        self.calls = {}
+        self.seconds = {}
+        self.originals = {}
+        for name in names:
+            if hasattr(target, name):
+                # attributes of the object itself are put back by remove, methods of its class are just unhidden
+                self.originals[name] = vars(target).get(name)
+                setattr(target, name, self.timed(name, getattr(target, name)))
+
+    def timed(self, name, method):
+        self.calls[name] = 0
+        self.seconds[name] = 0.0
+
+        def wrapper(*args):
+            start = time.perf_counter()
+            result = method(*args)
+            self.seconds[name] += time.perf_counter() - start
+            self.calls[name] += 1
+            if isinstance(result, types.GeneratorType):
+                return self.timed_generator(name, result)
+            return result
+        return wrapper
+
+    def timed_generator(self, name, generator):
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(generator)
+            except StopIteration:
+                self.seconds[name] += time.perf_counter() - start
+                return
+            self.seconds[name] += time.perf_counter() - start
+            yield item
+
+    def remove(self):
+        for name, original in self.originals.items():
+            if original is None:
+                delattr(self.target, name)
+            else:
+                setattr(self.target, name, original)
+
+    def report(self):
+        return {name: {"calls": self.calls[name], "time": round(self.seconds[name], 6)} for name in self.calls}
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread from a background thread and counts every distinct stack.
+    The report is in the collapsed format flame graph tools read, one "outer;inner count" line per stack.
+    Far cheaper than cProfile, so the timings are close to those of an unprofiled run.
+    """
+
+    def __init__(self, thread_id=None, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            stack = ";".join(reversed(names))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.samples += 1
+
+    def write(self, path):
+        with open(path, "w") as report_file:
+            for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1]):
+                report_file.write("%s %d\n" % (stack, count))
+
+
+@contextlib.contextmanager
+def profiled(kind, directory, name="search"):
+    """
+    Profiles the block and writes the report into directory, named after name and the time.
+    kind "cprofile" writes a pstats file (.prof) and the top functions by cumulative time (.txt),
+    kind "sampling" writes collapsed stacks (.folded).
+    """
+    os.makedirs(directory, exist_ok=True)
+    now = time.time()
+    base = os.path.join(directory, "%s-%s.%03d-%d" % (name, time.strftime("%Y%m%d-%H%M%S", time.localtime(now)),
+                                                      int(now * 1000) % 1000, os.getpid()))
+    if kind == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(base + ".prof")
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(40)
+            with open(base + ".txt", "w") as report_file:
+                report_file.write(text.getvalue())
+    elif kind == "sampling":
+        profiler = SamplingProfiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            profiler.write(base + ".folded")
+    else:
+        raise ValueError("unknown profiler: %s" % kind)
@@ -0,0 +1,43 @@
+"""
+FEN reading against positions whose castling and en passant fields do not fit the board.
+python -m unittest test_fen
+"""
+import unittest
+import engine
+import fen
+from bitboard import BitboardGameState
+from mailbox_board import MailboxGameState
+from ChessLib import CASTLE, ENPASSANT
+
+BOARDS = (engine.GameState, MailboxGameState, BitboardGameState)
+
+
+class FenTest(unittest.TestCase):
+    def test_castling_needs_king_and_rook(self):
+        self.assertEqual(fen.to_fen(fen.parse_fen("4k3/8/8/8/8/8/8/4K3 w KQkq - 0 1")),
+                         "4k3/8/8/8/8/8/8/4K3 w - - 0 1")
+        # only the rights whose rook is still on its corner are kept
+        position = fen.parse_fen("r3k3/8/8/8/8/8/8/4K2R w KQkq - 0 1")
+        self.assertEqual(fen.castling_fen(position.curr_castling_rights), "Kq")
+        for cls in BOARDS:
+            game_state = cls.from_fen("4k3/8/8/8/8/8/8/4K3 w KQkq - 0 1")
+            self.assertFalse([move for move in game_state.get_packed_moves() if move & CASTLE], cls.__name__)
+
+    def test_enpassant_needs_pawn(self):
+        # no black pawn on e5 behind e6
+        self.assertEqual(fen.parse_fen("4k3/8/8/8/8/8/8/4K3 w - e6 0 1").can_enpassant, ())
+        # the target square is taken
+        self.assertEqual(fen.parse_fen("4k3/8/4n3/4p3/8/8/8/4K3 w - e6 0 1").can_enpassant, ())
+        # the square is on the side to move's own half
+        self.assertEqual(fen.parse_fen("4k3/8/8/8/4P3/8/8/4K3 w - e3 0 1").can_enpassant, ())
+        position = fen.parse_fen("4k3/8/8/3Pp3/8/8/8/4K3 w - e6 0 1")
+        self.assertEqual(fen.enpassant_fen(position.can_enpassant), "e6")
+        for cls in BOARDS:
+            moves = cls(position).get_packed_moves()
+            self.assertEqual(len([move for move in moves if move & ENPASSANT]), 1, cls.__name__)
+            moves = cls.from_fen("4k3/8/8/8/8/8/8/4K3 w - e6 0 1").get_packed_moves()
+            self.assertFalse([move for move in moves if move & ENPASSANT], cls.__name__)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+"""
+Zobrist keys against the reference keys of the Polyglot book format specification.
+python -m unittest test_zobrist
+"""
+import unittest
+import engine
+from bitboard import BitboardGameState
+from mailbox_board import MailboxGameState
+
+# moves from the start position and the Polyglot key after each of them
+REFERENCE_KEYS = [("", 0x463B96181691FC9C), ("e2e4", 0x823C9B50FD114196), ("d7d5", 0x0756B94461C50FB0),
+                  ("e4e5", 0x662FAFB965DB29D4), ("f7f5", 0x22A48B5A8E47FF78), ("e1e2", 0x652A607CA3F242C1),
+                  ("e8f7", 0x00FDD303C946BDD9)]
+
+
+def play(game_state, notation):
+    for move in game_state.get_valid_moves():
+        if move.get_uci_notation() == notation:
+            game_state.make_move(move)
+            return
+    raise ValueError("illegal move: " + notation)
+
+
+class ZobristTest(unittest.TestCase):
+    def test_start_position(self):
+        self.assertEqual(engine.GameState().zobrist_key, 0x463B96181691FC9C)
+
+    def test_reference_keys(self):
+        for cls in (engine.GameState, MailboxGameState, BitboardGameState):
+            game_state = cls()
+            for notation, key in REFERENCE_KEYS:
+                if notation:
+                    play(game_state, notation)
+                self.assertEqual(game_state.zobrist_key, key, (cls.__name__, notation))
+                # the key made move by move is the one computed from scratch
+                self.assertEqual(cls.from_fen(game_state.to_fen()).zobrist_key, key)
+
+
+if __name__ == "__main__":
+    unittest.main()
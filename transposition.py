@@ -0,0 +1,95 @@
+"""
+Fixed size transposition table for the search.
+Entries live in preallocated arrays sized from a memory budget in MB.
+Every bucket has two slots: the first keeps the deepest search of the positions that
+map to it, the second is always replaced.
+"""
+from array import array
+
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# key, depth, score in centipawns, bound and best move, packed
+ENTRY_BYTES = 8 + 1 + 4 + 1 + 4
+NO_MOVE = -1
+
+
+class TranspositionTable:
+    def __init__(self, size_mb=16):
+        self.size_mb = size_mb
+        self.bucket_count = max(1, size_mb * 1024 * 1024 // (2 * ENTRY_BYTES))
+        size = 2 * self.bucket_count
+        self.keys = array("Q", bytes(8 * size))
+        self.depths = array("b", [-1]) * size
+        self.scores = array("i", bytes(4 * size))
+        self.bounds = array("b", bytes(size))
+        self.moves = array("i", [NO_MOVE]) * size
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.probes = 0
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def clear(self):
+        size = 2 * self.bucket_count
+        self.keys = array("Q", bytes(8 * size))
+        self.depths = array("b", [-1]) * size
+        self.moves = array("i", [NO_MOVE]) * size
+        self.reset_stats()
+
+    def probe(self, key):
+        # index of the slot holding key, or -1
+        self.probes += 1
+        slot = (key % self.bucket_count) * 2
+        keys = self.keys
+        if keys[slot] == key and self.depths[slot] >= 0:
+            self.hits += 1
+            return slot
+        if keys[slot + 1] == key and self.depths[slot + 1] >= 0:
+            self.hits += 1
+            return slot + 1
+        if self.depths[slot] >= 0 or self.depths[slot + 1] >= 0:
+            self.collisions += 1
+        else:
+            self.misses += 1
+        return -1
+
+    def best_move(self, key):
+        slot = self.probe(key)
+        if slot == -1:
+            return NO_MOVE
+        return self.moves[slot]
+
+    def store(self, key, depth, score, bound, move=NO_MOVE):
+        slot = (key % self.bucket_count) * 2
+        depths = self.depths
+        if self.keys[slot] != key and depth < depths[slot]:
+            # shallower than what the depth preferred slot holds
+            slot += 1
+        self.stores += 1
+        if depths[slot] >= 0 and self.keys[slot] != key:
+            self.overwrites += 1
+        if move == NO_MOVE and self.keys[slot] == key:
+            # keep the old best move rather than forgetting it
+            move = self.moves[slot]
+        self.keys[slot] = key
+        depths[slot] = min(depth, 127)
+        self.scores[slot] = score
+        self.bounds[slot] = bound
+        self.moves[slot] = move
+
+    def hashfull(self):
+        # permille of the first thousand slots in use, like UCI reports it
+        sample = min(1000, len(self.depths))
+        used = sum(1 for i in range(sample) if self.depths[i] >= 0)
+        return used * 1000 // sample
+
+    def stats(self):
+        return {"size_mb": self.size_mb, "entries": 2 * self.bucket_count, "probes": self.probes,
+                "hits": self.hits, "misses": self.misses, "collisions": self.collisions,
+                "stores": self.stores, "overwrites": self.overwrites, "hashfull": self.hashfull()}
@@ -0,0 +1,189 @@
+"""
+UCI front-end for running the engine without a display.
+Reads commands on stdin and answers on stdout, the search runs in a thread so
+stop and isready are answered while it thinks. Does not import pygame.
+"""
+import sys
+import threading
+import engine
+import ChessBot
+from transposition import TranspositionTable
+
+ENGINE_NAME = "ChessBot"
+ENGINE_AUTHOR = "ChessBot authors"
+# games are assumed to last this many more moves when the clock has no movestogo
+DEFAULT_MOVES_TO_GO = 30
+# seconds kept back for the time it takes to send the move
+MOVE_OVERHEAD = 0.05
+
+
+class UciReporter:
+    # takes the place of find_best_move's return queue and prints what it gets
+    # valid_moves are those of the searched position, a search without an answer plays the first of them
+    def __init__(self, output, context, valid_moves):
+        self.output = output
+        self.context = context
+        self.valid_moves = valid_moves
+
+    def put(self, item):
+        if isinstance(item, dict):
+            self.output("info depth %d %s nodes %d nps %d time %d hashfull %d pv %s" % (
+                item["depth"], format_score(item["score"]), item["nodes"], item["nps"],
+                int(item["time"] * 1000), self.context.transposition_table.hashfull(), " ".join(item["pv_uci"])))
+        elif item is None:
+            # 0000 only when there is no legal move at all
+            self.output("bestmove " + (self.valid_moves[0].get_uci_notation() if self.valid_moves else "0000"))
+        else:
+            self.output("bestmove " + item.get_uci_notation())
+
+
+class UciEngine:
+    def __init__(self, output=None):
+        self.output = output or write_line
+        self.game_state = engine.GameState()
+        # this engine's tables, another UciEngine in the same process searches with its own
+        self.context = ChessBot.SearchContext()
+        self.search_thread = None
+        self.stop_event = threading.Event()
+        self.threads = ChessBot.WORKERS
+        self.own_book = True
+
+    def handle(self, line):
+        # returns False once the engine should exit
+        tokens = line.split()
+        if not tokens:
+            return True
+        command = tokens[0]
+        if command == "uci":
+            self.output("id name " + ENGINE_NAME)
+            self.output("id author " + ENGINE_AUTHOR)
+            self.output("option name Hash type spin default %d min 1 max 1024" % ChessBot.TT_SIZE_MB)
+            self.output("option name Threads type spin default %d min 1 max 64" % ChessBot.WORKERS)
+            self.output("option name OwnBook type check default true")
+            self.output("uciok")
+        elif command == "isready":
+            self.output("readyok")
+        elif command == "setoption":
+            self.set_option(tokens[1:])
+        elif command == "ucinewgame":
+            self.stop()
+            self.context.new_game()
+            self.game_state = engine.GameState()
+        elif command == "position":
+            self.stop()
+            self.game_state = parse_position(tokens[1:])
+        elif command == "go":
+            self.stop()
+            self.go(tokens[1:])
+        elif command == "stop":
+            self.stop()
+        elif command == "quit":
+            self.stop()
+            ChessBot.shutdown_worker_pool()
+            return False
+        return True
+
+    def set_option(self, tokens):
+        # setoption name <name> value <value>
+        if "name" not in tokens or "value" not in tokens:
+            return
+        name = " ".join(tokens[tokens.index("name") + 1:tokens.index("value")]).lower()
+        value = " ".join(tokens[tokens.index("value") + 1:])
+        if name == "hash":
+            self.context.transposition_table = TranspositionTable(max(1, int(value)))
+        elif name == "threads":
+            self.threads = max(1, int(value))
+        elif name == "ownbook":
+            self.own_book = value.lower() == "true"
+
+    def go(self, tokens):
+        limits = parse_go(tokens, self.game_state.white_move)
+        valid_moves = self.game_state.get_valid_moves()
+        reporter = UciReporter(self.output, self.context, valid_moves)
+        if not valid_moves:
+            reporter.put(None)
+            return
+        if self.threads > 1:
+            # forked while the main thread is reading stdin, a worker would block closing its copy of stdin
+            ChessBot.get_worker_pool(self.threads)
+        self.stop_event.clear()
+        self.search_thread = threading.Thread(target=ChessBot.find_best_move,
+                                              args=(self.game_state, valid_moves, reporter),
+                                              kwargs=dict(limits, workers=self.threads, use_book=self.own_book,
+                                                          stop_event=self.stop_event, context=self.context))
+        self.search_thread.start()
+
+    def stop(self):
+        # ends a running search, it still reports its best move
+        if self.search_thread is not None:
+            self.stop_event.set()
+            self.search_thread.join()
+            self.search_thread = None
+
+
+def write_line(text):
+    sys.stdout.write(text + "\n")
+    sys.stdout.flush()
+
+
+def format_score(score):
+    # centipawns from the side to move's point of view, or mate in moves
+    if abs(score) >= ChessBot.MATE_THRESHOLD:
+        # a mate scores CHECKMATE less the plies to it
+        moves = (ChessBot.CHECKMATE - abs(score) + 1) // 2
+        return "score mate %d" % (moves if score > 0 else -moves)
+    return "score cp %d" % score
+
+
+def parse_position(tokens):
+    # position startpos|fen <fen> [moves <move> ...]
+    moves = tokens.index("moves") if "moves" in tokens else len(tokens)
+    if tokens and tokens[0] == "fen":
+        game_state = engine.GameState.from_fen(" ".join(tokens[1:moves]))
+    else:
+        game_state = engine.GameState()
+    for notation in tokens[moves + 1:]:
+        # promotions are always to a queen, so the promotion letter is not compared
+        move = next((move for move in game_state.get_valid_moves()
+                     if move.get_uci_notation()[:4] == notation[:4]), None)
+        if move is None:
+            raise ValueError("illegal move in position: " + notation)
+        game_state.make_move(move)
+    return game_state
+
+
+def parse_go(tokens, white_move):
+    # turns the go arguments into find_best_move keywords
+    values = {}
+    for i, token in enumerate(tokens):
+        if token in ("wtime", "btime", "winc", "binc", "movestogo", "movetime", "depth", "nodes"):
+            values[token] = int(tokens[i + 1])
+    limits = {"time_limit": None, "node_limit": values.get("nodes"),
+              "max_depth": values.get("depth", ChessBot.MAX_DEPTH)}
+    if "movetime" in values:
+        limits["time_limit"] = max(values["movetime"] / 1000 - MOVE_OVERHEAD, 0.01)
+    else:
+        clock = values.get("wtime" if white_move else "btime")
+        if clock is not None:
+            increment = values.get("winc" if white_move else "binc", 0)
+            moves_to_go = values.get("movestogo", DEFAULT_MOVES_TO_GO)
+            budget = clock / moves_to_go + increment * 0.8
+            # never plan to use more than half of what is left on the clock
+            limits["time_limit"] = max(min(budget, clock / 2) / 1000 - MOVE_OVERHEAD, 0.01)
+    return limits
+
+
+def main():
+    uci_engine = UciEngine()
+    for line in sys.stdin:
+        try:
+            if not uci_engine.handle(line):
+                break
+        except (ValueError, IndexError, KeyError) as error:
+            write_line("info string error " + str(error))
+    uci_engine.stop()
+    ChessBot.shutdown_worker_pool()
+
+
+if __name__ == "__main__":
+    main()